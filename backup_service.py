@@ -1,15 +1,29 @@
 # backup_service.py
+import json
+import os
+import socket
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+from flask import current_app
+
 from logger_conf import logger
-from device import Device as SSHDevice
+from device import Device as SSHDevice, phase_timer
 import config
 from extensions import db
 from models import Device as DBDevice, BackupLog
 import security_utils
+import content_cache
+import delta_storage
+import run_lease
+import job_queue
+import device_health
+import metrics
+import reachability
+from text_processing import content_fingerprint, compile_volatile_pattern
 # NOWY IMPORT
 from notification_service import NotificationService
 
@@ -21,20 +35,66 @@ class BackupService:
         self.backup_dir.resolve().mkdir(parents=True, exist_ok=True)
         logger.info(f"--> KATALOG BACKUPÓW: {self.backup_dir.resolve()}")
 
-        self._lock = threading.Lock()
-        self._cancel_requested = False
+        # Dzierżawa uruchomienia w bazie (wspólna dla workerów gunicorna i kontenera cron);
+        # ustawiona tylko w procesie, który właśnie wykonuje backup
+        self._lease = None
+
+        # Powiadomienia o zmianie stanu (strumień statusu w panelu czeka na nie zamiast odpytywać bazę)
+        self._changed = threading.Condition()
+        self._change_seq = 0
+
+        self._volatile_re = compile_volatile_pattern(config.BACKUP_VOLATILE_PATTERN)
 
     def init_app(self, app):
         """Pozwala przypisać aplikację Flask po utworzeniu instancji."""
         self.app = app
 
     def is_running(self) -> bool:
-        return self._lock.locked()
+        """Czy backup trwa - w tym lub dowolnym innym procesie (wymaga kontekstu aplikacji)."""
+        return self._lease is not None or run_lease.active_lease() is not None
+
+    def progress(self):
+        """Postęp trwającego uruchomienia (z dowolnego procesu) albo None."""
+        lease = run_lease.active_lease()
+        if lease is None:
+            return None
+        run = job_queue.current_run()
+        counts = job_queue.run_counts(run.id) if run else {}
+        success, failed, skipped = counts.get('success', 0), counts.get('error', 0), counts.get('skipped', 0)
+        return {"trigger_type": lease.trigger_type, "total": run.total if run else 0,
+                "done": success + failed + skipped, "success": success, "failed": failed, "skipped": skipped,
+                "cancel_requested": lease.cancel_requested}
+
+    @property
+    def _cancel_requested(self) -> bool:
+        return self._lease is not None and self._lease.cancelled
+
+    def notify_change(self) -> None:
+        with self._changed:
+            self._change_seq += 1
+            self._changed.notify_all()
+
+    @property
+    def change_seq(self) -> int:
+        return self._change_seq
+
+    def wait_for_change(self, seq: int, timeout: float) -> int:
+        """Czeka (najwyżej timeout s), aż numer zmiany będzie inny niż seq. Zwraca bieżący numer."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._change_seq != seq, timeout)
+            return self._change_seq
 
     def request_cancel(self) -> None:
-        if self.is_running():
-            self._cancel_requested = True
-            logger.info("Otrzymano żądanie anulowania backupu.")
+        # Flaga w bazie - odczyta ją proces, który faktycznie wykonuje backup
+        if run_lease.request_cancel():
+            logger.info("Wysłano żądanie anulowania backupu.")
+        if self._lease is not None:
+            self._lease.cancelled = True
+
+    def cancel_local_run(self) -> None:
+        """Anuluje uruchomienie wykonywane przez ten proces - bez zapytań do bazy (np. w obsłudze SIGTERM)."""
+        if self._lease is not None:
+            self._lease.cancelled = True
 
     def backup_all_devices_thread(self):
         """Funkcja uruchamiana w wątku (z GUI)."""
@@ -45,69 +105,209 @@ class BackupService:
         with self.app.app_context():
             self.backup_devices_logic(trigger_type='manual')
 
-    def backup_devices_logic(self, selected_ips=None, trigger_type='manual'):
-        if not self._lock.acquire(blocking=False):
-            return
-
-        self._cancel_requested = False
+    def backup_devices_logic(self, selected_ips=None, trigger_type='manual', max_workers=None):
+        """
+        Backup wybranych (lub wszystkich włączonych) urządzeń.
+        Uruchomienie trafia do kolejki w bazie (job_queue) jako zadania per urządzenie;
+        ten proces wykonuje je w max_workers wątkach (domyślnie config.BACKUP_MAX_WORKERS),
+        a równolegle mogą je pobierać dodatkowe workery (`flask backup-worker`).
+        Zwraca False, jeśli backup nie ruszył, bo dzierżawę trzyma inny proces.
+        """
+        app = self.app or current_app._get_current_object()
+        lease = run_lease.Lease(app)
+        if not lease.acquire(trigger_type):
+            logger.info(f"Backup już trwa (w tym lub innym procesie) - pomijam uruchomienie typu {trigger_type}.")
+            return False
 
-        # === ZMIENNE DO STATYSTYK ===
-        start_time = time.time()
-        total_devices = 0
-        success_count = 0
-        fail_count = 0
-        failed_ips = []
-        # ============================
+        self._lease = lease
+        self.notify_change()
 
         try:
+            # Poprzedni właściciel dzierżawy mógł zginąć w trakcie - jego zadania nie będą dokończone
+            job_queue.close_abandoned_runs()
+
             devices = DBDevice.query.filter_by(enabled=True).all()
             if selected_ips:
                 devices = [d for d in devices if d.ip in selected_ips]
 
-            total_devices = len(devices)
-            logger.info(f"Start backupu {total_devices} urządzeń. Typ: {trigger_type}")
-
-            for dev in devices:
-                if self._cancel_requested:
-                    logger.info("Przerwano backup.")
-                    break
-
-                # Odbieramy wynik operacji (True/False)
-                is_success = self._process_single_device(dev, trigger_type)
-
-                if is_success:
-                    success_count += 1
-                else:
-                    fail_count += 1
-                    failed_ips.append(dev.ip)
-
-            # === WYSYŁANIE POWIADOMIENIA (TYLKO CRON) ===
-            # Nie wysyłamy powiadomień przy ręcznym uruchomieniu z GUI,
-            # chyba że chcesz usunąć ten warunek 'if'.
-            if trigger_type == 'cron':
-                duration = time.time() - start_time
-                NotificationService.send_backup_summary(
-                    total=total_devices,
-                    success=success_count,
-                    failed=fail_count,
-                    failed_ips=failed_ips,
-                    duration_seconds=duration
-                )
-            # ============================================
+            devices, unreachable = self._preflight(devices)
+            run = job_queue.create_run(trigger_type, devices, failed=unreachable)
+            run_id = run.id
+            if unreachable:
+                metrics.BACKUPS.labels(status='error', trigger=trigger_type).inc(len(unreachable))
+            to_backup = len(devices) - len(unreachable)
+            workers = max(1, min(max_workers or config.BACKUP_MAX_WORKERS, to_backup or 1))
+            logger.info(f"Start backupu {to_backup} urządzeń (uruchomienie #{run_id}, "
+                        f"nieosiągalne: {len(unreachable)}). Typ: {trigger_type}, wątki: {workers}")
+
+            worker_id = self._worker_id()
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup") as pool:
+                    for n in range(workers):
+                        pool.submit(self._job_loop, app, f"{worker_id}/{n}", run_id)
+            # Zadania wykonywane jeszcze przez inne workery (i te, które wrócą do kolejki po ich awarii)
+            self._job_loop(app, f"{worker_id}/0", run_id, wait_for_others=True)
+
+            if self._cancel_requested:
+                logger.info("Przerwano backup.")
+            # Pusta lista urządzeń albo anulowanie - nikt nie zakończył ostatniego zadania
+            self._finalize_run(run_id)
 
         except Exception as e:
             logger.error(f"Błąd w pętli backupu: {e}")
         finally:
-            self._lock.release()
-            self._cancel_requested = False
+            self._lease = None
+            try:
+                lease.release()
+            except Exception as e:
+                logger.error(f"Nie udało się zwolnić dzierżawy backupu: {e}")
+            self.notify_change()
+        return True
 
-    def _process_single_device(self, db_dev, trigger_type) -> bool:
+    def _preflight(self, devices):
+        """
+        Sprawdza TCP/22 wszystkich urządzeń naraz (reachability.py), zanim wątki zaczną czekać na SSH.
+        Zwraca (urządzenia w kolejności backupu, {ip: błąd} nieosiągalnych). Nieosiągalne dostają
+        status błędu od razu; pozostałe są ustawiane od najdłuższego średniego czasu backupu
+        (długie zaczynają pierwsze i nie wydłużają końcówki uruchomienia), urządzenia z otwartym
+        circuit breakerem - na koniec (i tak zostaną pominięte).
+        """
+        now = datetime.now()
+        open_circuit = [d for d in devices if device_health.is_circuit_open(d, now)]
+        candidates = [d for d in devices if not device_health.is_circuit_open(d, now)]
+        if not config.PREFLIGHT_ENABLED or not candidates:
+            return candidates + open_circuit, {}
+
+        results = reachability.sweep([d.ip for d in candidates])
+        unreachable = {}
+        for d in candidates:
+            probe = results[d.ip]
+            if probe.reachable:
+                continue
+            unreachable[d.ip] = f"Brak połączenia TCP/{config.SSH_PORT} (pre-flight): {probe.error}"
+            d.last_status = 'error'
+            d.last_error = unreachable[d.ip]
+            device_health.record_failure(d, now)
+        db.session.commit()
+        if unreachable:
+            logger.warning(f"Pre-flight: nieosiągalne urządzenia: {', '.join(unreachable)}")
+            self.notify_change()
+
+        reachable = [d for d in candidates if d.ip not in unreachable]
+        # Brak historii = traktujemy jak najdłuższe (nie wiadomo, ile potrwa)
+        reachable.sort(key=lambda d: d.avg_backup_seconds if d.avg_backup_seconds is not None else float('inf'),
+                       reverse=True)
+        return reachable + open_circuit + [d for d in candidates if d.ip in unreachable], unreachable
+
+    def run_worker(self, threads, stop):
+        """
+        Worker kolejki (`flask backup-worker`): wykonuje zadania dowolnego trwającego uruchomienia,
+        dopóki nie zostanie ustawione zdarzenie stop (SIGTERM). Zaczęte zadania są dokańczane.
+        """
+        app = self.app or current_app._get_current_object()
+        worker_id = self._worker_id()
+        logger.info(f"Worker kolejki backupu {worker_id} uruchomiony (wątki: {threads}).")
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="backup") as pool:
+            for n in range(threads):
+                pool.submit(self._job_loop, app, f"{worker_id}/{n}", None, stop)
+        logger.info(f"Worker kolejki backupu {worker_id} zatrzymany.")
+
+    @staticmethod
+    def _worker_id():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _job_loop(self, app, worker, run_id=None, stop=None, wait_for_others=False):
+        """
+        Pobiera i wykonuje zadania z kolejki. Z run_id (proces, który zlecił uruchomienie) kończy,
+        gdy nie ma zadań do pobrania, a z wait_for_others - dopiero gdy uruchomienie nie ma otwartych
+        zadań także w innych workerach (porzucone mogą wrócić do kolejki). Bez run_id pracuje do ustawienia stop.
+        """
+        try:
+            with app.app_context():
+                while not (stop and stop.is_set()):
+                    if run_id is not None and self._cancel_requested:
+                        job_queue.cancel_pending(run_id)
+                        job = None
+                    else:
+                        job = job_queue.claim_job(worker, run_id)
+
+                    if job is not None:
+                        self._execute_job(job, worker)
+                        continue
+                    if run_id is not None and not (wait_for_others and job_queue.has_open_jobs(run_id)):
+                        return
+                    if stop:
+                        stop.wait(config.BACKUP_WORKER_POLL_SECONDS)
+                    else:
+                        time.sleep(config.BACKUP_WORKER_POLL_SECONDS)
+        except Exception as e:
+            logger.error(f"Nieobsłużony błąd wątku backupu {worker}: {e}")
+
+    def _execute_job(self, job, worker):
+        """Backup urządzenia z zadania; zapis wyniku i - po ostatnim zadaniu - podsumowanie uruchomienia."""
+        job_id, run_id, trigger_type = job.id, job.run_id, job.run.trigger_type
+        try:
+            db_dev = db.session.get(DBDevice, job.device_id)
+            if db_dev is None:
+                is_success, error = False, "Urządzenie usunięte z listy"
+            else:
+                with job_queue.JobHeartbeat(current_app._get_current_object(), job_id, worker):
+                    is_success = self._process_single_device(db_dev, trigger_type, run_id)
+                if is_success is None:
+                    error = f"Pominięto (circuit breaker do {db_dev.circuit_open_until.strftime('%Y-%m-%d %H:%M')})"
+                else:
+                    error = None if is_success else db_dev.last_error
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Błąd wykonania zadania #{job_id} ({job.device_ip}): {e}")
+            is_success, error = False, str(e)
+
+        if job_queue.finish_job(job_id, worker, is_success, error):
+            status = 'skipped' if is_success is None else ('success' if is_success else 'error')
+            metrics.BACKUPS.labels(status=status, trigger=trigger_type).inc()
+        else:
+            logger.warning(f"Zadanie #{job_id} wykonał w międzyczasie inny worker - pomijam wynik.")
+        self._finalize_run(run_id)
+
+    def _finalize_run(self, run_id):
+        """Zamyka uruchomienie, jeśli to było jego ostatnie zadanie, i wysyła podsumowanie."""
+        summary = job_queue.finalize_run(run_id)
+        if summary is None:
+            return
+        self.notify_change()
+        logger.info(f"Zakończono uruchomienie #{run_id}: sukces {summary['success']}, błędy {summary['failed']}, "
+                    f"pominięte {summary['skipped']}, anulowane {summary['cancelled']} (z {summary['total']}), "
+                    f"czas {summary['duration_seconds']:.0f} s")
+
+        # === WYSYŁANIE POWIADOMIENIA (TYLKO CRON) ===
+        # Nie wysyłamy powiadomień przy ręcznym uruchomieniu z GUI,
+        # chyba że chcesz usunąć ten warunek 'if'.
+        if summary['trigger_type'] == 'cron':
+            NotificationService.send_backup_summary(
+                total=summary['total'],
+                success=summary['success'],
+                failed=summary['failed'],
+                failed_ips=summary['failed_ips'],
+                duration_seconds=summary['duration_seconds'],
+                skipped_ips=summary['skipped_ips']
+            )
+        # ============================================
+
+    def _process_single_device(self, db_dev, trigger_type, run_id=None) -> bool:
         """
         Przetwarza jedno urządzenie.
-        Zwraca True jeśli backup zakończył się sukcesem, False w przeciwnym razie.
+        Zwraca True jeśli backup zakończył się sukcesem, False w przeciwnym razie,
+        None jeśli urządzenie pominięto (otwarty circuit breaker - patrz device_health.py).
         """
         ip = db_dev.ip
         success_flag = False  # Flaga wyniku
+        started = time.monotonic()
+        stored_bytes = 0  # nowy plik na dysku (0 dla "bez zmian")
+
+        if device_health.is_circuit_open(db_dev):
+            logger.info(f"{ip}: pominięty - {db_dev.consecutive_failures} nieudanych połączeń z rzędu "
+                        f"(circuit breaker do {db_dev.circuit_open_until.strftime('%Y-%m-%d %H:%M')})")
+            return None
 
         # 1. Start - ustawiamy status running
         try:
@@ -118,17 +318,24 @@ class BackupService:
             db.session.rollback()
             logger.error(f"Błąd bazy danych przy starcie backupu dla {ip} - pomijam.")
             return False
+        self.notify_change()
+        metrics.IN_PROGRESS.inc()
 
         ssh_dev = SSHDevice(
             ip=ip,
             username=config.SSH_USERNAME,
             password=config.SSH_PASSWORD,
-            commands=config.COMMANDS
+            commands=config.COMMANDS,
+            connect_timeout=device_health.connect_timeout(db_dev),
+            max_retries=device_health.connect_attempts(db_dev)
         )
+        # Fazy po stronie serwisu dopisujemy do czasów zmierzonych w sesji SSH
+        timings = ssh_dev.timings
 
         try:
             # 2. Logika SSH (może rzucić wyjątkiem)
             ssh_dev.connect()
+            device_health.record_success(db_dev, ssh_dev.connect_seconds, ssh_dev.rtt_ms)
             ssh_dev.run_commands()
             content, sysname = ssh_dev.get_result()
 
@@ -136,31 +343,75 @@ class BackupService:
                 db_dev.sysname = sysname
 
             if content:
-                safe_sysname = "".join(c for c in sysname if c.isalnum() or c in ('-', '_')) if sysname else ""
-                base_name = f"{ip}_{safe_sysname}" if safe_sysname else ip
-                timestamp = datetime.now().strftime("%d%m%y_%H%M")
-
-                filename = f"{base_name}_{timestamp}.txt"
-                file_path = self.backup_dir / filename
-
-                # 3. Zapis i Szyfrowanie
-                if security_utils.encrypt_to_file(content, file_path):
-                    db_dev.last_status = 'success'
-                    db_dev.last_backup_time = datetime.now()
-
+                with phase_timer(timings, "fingerprint"):
+                    content_hash = content_fingerprint(content, self._volatile_re)
+                log = None
+
+                with phase_timer(timings, "db_lookup"):
+                    previous = self._find_unchanged_backup(ip, content_hash)
+                if previous:
+                    # 3a. Konfiguracja bez zmian - nowy wpis wskazuje na istniejący plik
                     log = BackupLog(
                         device_ip=ip,
-                        filename=filename,
+                        filename=previous.filename,
                         status='success',
-                        size_bytes=file_path.stat().st_size,
-                        encrypted=True,
-                        trigger_type=trigger_type
+                        size_bytes=previous.size_bytes,
+                        logical_size_bytes=previous.logical_size_bytes,
+                        encrypted=previous.encrypted,
+                        trigger_type=trigger_type,
+                        content_hash=content_hash,
+                        unchanged=True,
+                        base_filename=previous.base_filename
                     )
-                    db.session.add(log)
+                    logger.info(f"{ip}: konfiguracja bez zmian - wpis wskazuje na {previous.filename}")
+                else:
+                    safe_sysname = "".join(c for c in sysname if c.isalnum() or c in ('-', '_')) if sysname else ""
+                    base_name = f"{ip}_{safe_sysname}" if safe_sysname else ip
+                    timestamp = datetime.now().strftime("%d%m%y_%H%M")
+
+                    filename = f"{base_name}_{timestamp}.txt"
+                    file_path = self.backup_dir / filename
+
+                    # Dwa backupy w tej samej minucie nie mogą nadpisać pliku,
+                    # na który wskazują już inne wpisy (np. "bez zmian").
+                    suffix = 2
+                    while file_path.exists():
+                        filename = f"{base_name}_{timestamp}_{suffix}.txt"
+                        file_path = self.backup_dir / filename
+                        suffix += 1
+
+                    # 3b. Zapis i Szyfrowanie (w trybie delta - jako delta względem snapshotu)
+                    with phase_timer(timings, "encrypt_write"):
+                        base_filename, payload = self._prepare_payload(ip, content)
+                        stored = security_utils.encrypt_to_file(payload, file_path)
+                    if stored:
+                        log = BackupLog(
+                            device_ip=ip,
+                            filename=filename,
+                            status='success',
+                            size_bytes=file_path.stat().st_size,
+                            logical_size_bytes=len(content.encode('utf-8')),
+                            encrypted=True,
+                            trigger_type=trigger_type,
+                            content_hash=content_hash,
+                            base_filename=base_filename
+                        )
+                        stored_bytes = log.size_bytes
+
+                if log:
+                    db_dev.last_status = 'success'
+                    db_dev.last_backup_time = datetime.now()
+                    with phase_timer(timings, "db_write"):
+                        db.session.add(log)
+                        db.session.flush()
+                        db_dev.latest_success_log_id = log.id
 
-                    if trigger_type == 'cron':
-                        self._cleanup_old_backups(ip)
+                        if trigger_type == 'cron':
+                            self._cleanup_old_backups(ip)
 
+                    duration = time.monotonic() - started
+                    self._attach_timings(log, ssh_dev, run_id, duration)
+                    device_health.record_backup_duration(db_dev, duration)
                     success_flag = True  # SUKCES!
                 else:
                     db_dev.last_status = 'error'
@@ -180,6 +431,11 @@ class BackupService:
             try:
                 db_dev.last_status = 'error'
                 db_dev.last_error = str(e)[:250]
+                # Zmiany sprzed błędu zostały wycofane - stan połączenia zapisujemy ponownie
+                if ssh_dev.connect_seconds is None:
+                    device_health.record_failure(db_dev)
+                else:
+                    device_health.record_success(db_dev, ssh_dev.connect_seconds, ssh_dev.rtt_ms)
                 db.session.commit()
             except Exception as e2:
                 logger.error(f"Nie udało się zapisać statusu błędu do DB dla {ip}: {e2}")
@@ -187,9 +443,76 @@ class BackupService:
 
         finally:
             ssh_dev.disconnect()
+            self.notify_change()
+            metrics.IN_PROGRESS.dec()
+            metrics.observe_device('success' if success_flag else 'error', time.monotonic() - started,
+                                   ssh_dev, stored_bytes)
 
         return success_flag
 
+    @staticmethod
+    def _attach_timings(log, ssh_dev, run_id, duration: float) -> None:
+        """
+        Zapisuje pomiar w wpisie backupu. Końcowy COMMIT nie jest wliczony
+        (wpis zapisujemy w tej samej transakcji) - db_write to zapytania przed nim.
+        """
+        log.run_id = run_id
+        log.duration_seconds = duration
+        log.bytes_received = ssh_dev.bytes_received
+        log.timings = json.dumps({
+            'phases': {name: round(seconds, 4) for name, seconds in ssh_dev.timings.items()},
+            'bytes': {f"cmd_{i}": size for i, size in ssh_dev.output_bytes.items()},
+            'attempts': ssh_dev.attempts,
+        })
+        logger.debug(f"{log.device_ip}: backup w {duration:.1f} s, odebrano {ssh_dev.bytes_received} B")
+
+    def _prepare_payload(self, ip: str, content: str):
+        """
+        Zwraca (base_filename, treść do zaszyfrowania).
+        W trybie "delta" zapisujemy deltę względem ostatniego snapshotu urządzenia,
+        dopóki liczba delt tego snapshotu nie osiągnie BACKUP_DELTA_CHAIN_LENGTH.
+        """
+        if config.BACKUP_STORAGE_MODE != 'delta':
+            return None, content
+
+        base = BackupLog.query.filter_by(device_ip=ip, status='success', base_filename=None) \
+            .order_by(BackupLog.created_at.desc()) \
+            .first()
+        if not base:
+            return None, content
+
+        base_path = self.backup_dir / base.filename
+        deltas = db.session.query(db.func.count(db.distinct(BackupLog.filename))) \
+            .filter(BackupLog.base_filename == base.filename) \
+            .scalar()
+        if deltas >= config.BACKUP_DELTA_CHAIN_LENGTH or not base_path.exists():
+            return None, content
+
+        try:
+            base_text = security_utils.decrypt_from_file(base_path)
+            delta = delta_storage.encode_delta(base_text, content, base.filename)
+        except Exception as e:
+            logger.warning(f"{ip}: nie udało się zbudować delty ({e}) - zapisuję pełną kopię")
+            return None, content
+
+        # Delta większa niż połowa pełnej kopii nie ma sensu - zaczynamy nowy snapshot
+        if len(delta) > len(content) // 2:
+            return None, content
+        return base.filename, delta
+
+    def _find_unchanged_backup(self, ip: str, content_hash: str):
+        """
+        Zwraca poprzedni udany backup urządzenia, jeśli ma ten sam odcisk treści
+        i jego plik wciąż istnieje. W przeciwnym razie None.
+        """
+        previous = BackupLog.query.filter_by(device_ip=ip, status='success') \
+            .order_by(BackupLog.created_at.desc()) \
+            .first()
+
+        if previous and previous.content_hash == content_hash and (self.backup_dir / previous.filename).exists():
+            return previous
+        return None
+
     def _cleanup_old_backups(self, ip: str):
         try:
             logs = BackupLog.query.filter_by(device_ip=ip, status='success', trigger_type='cron') \
@@ -200,18 +523,30 @@ class BackupService:
 
             if len(logs) > limit:
                 logs_to_delete = logs[limit:]
-                count = 0
-                for log_entry in logs_to_delete:
-                    file_path = self.backup_dir / log_entry.filename
+
+                # Plik może być współdzielony z wpisami "bez zmian" albo być bazą delt -
+                # usuwamy go dopiero, gdy nie wskazuje na niego żaden pozostały wpis.
+                for filename in BackupLog.unreferenced_files(logs_to_delete):
+                    file_path = self.backup_dir / filename
                     try:
                         if file_path.exists():
                             file_path.unlink()
                     except OSError:
                         pass
+                    content_cache.web_cache.invalidate(filename)
 
+                count = 0
+                for log_entry in logs_to_delete:
                     db.session.delete(log_entry)
                     count += 1
 
+                # Wskaźnik ostatniego backupu mógł wskazywać na usunięty wpis (np. MAX_BACKUPS_PER_DEVICE=0)
+                deleted_ids = {log_entry.id for log_entry in logs_to_delete}
+                dev = DBDevice.query.filter_by(ip=ip).first()
+                if dev and dev.latest_success_log_id in deleted_ids:
+                    db.session.flush()
+                    dev.refresh_latest_success()
+
                 logger.info(f"Rotacja (Cron) dla {ip}: usunięto {count} starych plików.")
         except Exception as e:
             logger.error(f"Błąd rotacji dla {ip}: {e}")
\ No newline at end of file
@@ -0,0 +1,196 @@
+# benchmarks/bench_backup_e2e.py
+"""
+Benchmark end-to-end: BackupService.backup_devices_logic na N symulowanych urządzeniach
+(benchmarks/fake_olt.py) na localhost - SSH, przetwarzanie, szyfrowanie, zapis, baza SQLite.
+
+Symulator działa w osobnym procesie, a każda wartość --workers w osobnym procesie potomnym
+(czysta baza i katalog backupów, osobny pomiar CPU i szczytowego RSS - bez kosztu symulatora).
+
+Raport: urządzenia/min, p50/p95 czasu jednego urządzenia, czas CPU i szczytowy RSS procesu backupu.
+
+Uruchomienie (z katalogu głównego projektu):
+    python benchmarks/bench_backup_e2e.py
+    python benchmarks/bench_backup_e2e.py --devices 200 --workers 1 8 32 --config-lines 20000 --latency 0.05
+    python benchmarks/bench_backup_e2e.py --devices 50 --flaky 3 --hang 2 --ssh-timeout 5
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_olt import add_arguments, device_ip  # noqa: E402
+
+COMMANDS = {
+    "huawei": ["enable", "config", "mmi-mode original-output", "display current-configuration",
+               "undo mmi-mode original-output"],
+    "zte": ["terminal length 0", "", "", "show running-config", ""],
+}
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_child(args) -> dict:
+    """Jedno uruchomienie backupu w tym procesie (wołane w procesie potomnym)."""
+    # Konfiguracja aplikacji jest czytana przy imporcie - zmienne środowiskowe ustawiamy wcześniej
+    from cryptography.fernet import Fernet
+
+    workdir = tempfile.mkdtemp(prefix="olt-bench-")
+    os.chdir(workdir)  # logs/app.log trafia do katalogu tymczasowego
+    os.environ.update({
+        "DB_TYPE": "sqlite",
+        "DATA_DIR": workdir,
+        "BACKUP_DIR": os.path.join(workdir, "backups"),
+        "SECRET_KEY": "bench",
+        "BACKUP_ENCRYPTION_KEY": Fernet.generate_key().decode(),
+        "SSH_USERNAME": "bench",
+        "SSH_PASSWORD": "bench",
+        "SSH_PORT": str(args.port),
+        "SSH_TIMEOUT": str(args.ssh_timeout),
+        "SSH_RETRY_BASE_DELAY": "0.5",
+        "BACKUP_MAX_WORKERS": str(args.workers[0]),
+    })
+    for i, command in enumerate(COMMANDS[args.style], start=1):
+        os.environ[f"COMMAND_{i}"] = command
+
+    import backup_service
+    from extensions import db
+    from models import Device
+    from webapp import app
+
+    durations = []
+    lock = threading.Lock()
+    process_single_device = backup_service.BackupService._process_single_device
+
+    def timed(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return process_single_device(self, *args, **kwargs)
+        finally:
+            with lock:
+                durations.append(time.perf_counter() - started)
+
+    backup_service.BackupService._process_single_device = timed
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Device(ip=device_ip(i)) for i in range(args.devices))
+        db.session.commit()
+
+        service = backup_service.BackupService(app)
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.perf_counter()
+        service.backup_devices_logic(trigger_type='manual', max_workers=args.workers[0])
+        wall = time.perf_counter() - started
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+        ok = Device.query.filter_by(last_status='success').count()
+
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        "workers": args.workers[0],
+        "devices": args.devices,
+        "ok": ok,
+        "wall": wall,
+        "devices_per_min": args.devices / wall * 60 if wall else 0.0,
+        "p50": percentile(durations, 0.50),
+        "p95": percentile(durations, 0.95),
+        "cpu": cpu,
+        "peak_rss_mb": usage_after.ru_maxrss / 1024,  # Linux: kilobajty
+    }
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Symulator nie nasłuchuje na porcie {port}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark backupu na symulowanych OLT")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--flaky", type=int, default=0, help="ile urządzeń ma niestabilne logowanie")
+    parser.add_argument("--hang", type=int, default=0, help="ile urządzeń zawiesza się po zalogowaniu")
+    parser.add_argument("--ssh-timeout", type=int, default=5)
+    parser.add_argument("--port", type=int, default=0, help="port symulatora (0 = wolny)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        print("RESULT " + json.dumps(run_child(args)), flush=True)
+        return
+
+    args.port = args.port or free_port()
+    ips = [device_ip(i) for i in range(args.devices)]
+    hang = ips[:args.hang]
+    flaky = ips[args.hang:args.hang + args.flaky]
+    simulator_args = [
+        "--port", str(args.port), "--style", args.style, "--config-lines", str(args.config_lines),
+        "--latency", str(args.latency), "--bandwidth", str(args.bandwidth), "--page-lines", str(args.page_lines),
+        "--flaky-rate", str(args.flaky_rate),
+    ]
+    if hang:
+        simulator_args += ["--hang", *hang]
+    if flaky:
+        simulator_args += ["--flaky", *flaky]
+
+    simulator = subprocess.Popen([sys.executable, str(Path(__file__).with_name("fake_olt.py")), *simulator_args],
+                                 stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port)
+        print(f"Urządzeń: {args.devices} (zawieszone: {len(hang)}, niestabilne: {len(flaky)}), "
+              f"styl: {args.style}, linii konfiguracji: {args.config_lines}, opóźnienie: {args.latency}s")
+        print(f"{'wątki':>6} {'OK':>6} {'czas [s]':>9} {'urz./min':>9} {'p50 [s]':>8} {'p95 [s]':>8} "
+              f"{'CPU [s]':>8} {'RSS [MB]':>9}")
+
+        for workers in args.workers:
+            child = subprocess.run(
+                [sys.executable, __file__, *sys.argv[1:], "--child", "--port", str(args.port),
+                 "--workers", str(workers)],
+                cwd=ROOT, capture_output=True, text=True,
+            )
+            lines = [line for line in child.stdout.splitlines() if line.startswith("RESULT ")]
+            if not lines:
+                print(f"{workers:>6} błąd uruchomienia:\n{child.stderr[-2000:]}")
+                continue
+            r = json.loads(lines[-1][len("RESULT "):])
+            print(f"{r['workers']:>6} {r['ok']:>6} {r['wall']:>9.2f} {r['devices_per_min']:>9.1f} "
+                  f"{r['p50']:>8.2f} {r['p95']:>8.2f} {r['cpu']:>8.2f} {r['peak_rss_mb']:>9.1f}")
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+if __name__ == "__main__":
+    main()
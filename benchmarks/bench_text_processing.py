@@ -0,0 +1,101 @@
+# benchmarks/bench_text_processing.py
+"""
+Mikro-benchmark przetwarzania tekstu konfiguracji.
+
+Porównuje dawny, wieloprzebiegowy potok (trim_text -> usunięcie pierwszej linii
+-> remove_empty_lines -> join_lines) z jednoprzebiegowym process_text
+na syntetycznych konfiguracjach 1k / 100k / 1M linii. Przed pomiarem sprawdza,
+że oba warianty dają identyczny wynik.
+
+Uruchomienie (z katalogu głównego projektu):
+    python benchmarks/bench_text_processing.py
+    python benchmarks/bench_text_processing.py --sizes 1000 100000 --repeat 5
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from text_processing import trim_text, remove_empty_lines, join_lines, process_text, process_chunks  # noqa: E402
+
+
+def legacy_process_text(text: str) -> str:
+    """Dawna implementacja process_text - punkt odniesienia."""
+    trimmed = trim_text(text)
+    lines = trimmed.splitlines()
+    if lines:
+        lines = lines[1:]
+    no_first = "\n".join(lines)
+    no_empty = remove_empty_lines(no_first)
+    return join_lines(no_empty)
+
+
+def make_config(n_lines: int) -> str:
+    """Syntetyczny wynik 'display current-configuration' w stylu Huawei."""
+    out = [
+        "display current-configuration",
+        "{ <cr>|ont<K>|port<K>||<K> }:",
+        "",
+        "  Command:",
+        "          display current-configuration",
+        "[MA5800-X15V100R019: 8034]",
+        "#",
+        " sysname MA5800-BENCH",
+    ]
+    i = 0
+    while len(out) < n_lines - 3:
+        # Typowe linie ONT, co jakiś czas pusta linia i linia zawinięta przez terminal
+        out.append(f' ont add 0 {i % 128} sn-auth "48575443{i:08X}" omci ont-lineprofile-id 10 ont-srvprofile-id 10')
+        if i % 50 == 0:
+            out.append("")
+        if i % 97 == 0:
+            out.append(f' ont port native-vlan 0 {i % 128} eth 1 vlan 100 pri')
+            out.append('ority 0')
+        if i % 500 == 0:
+            out.append("#")
+            out.append(f"interface gpon 0/{i % 16}")
+        i += 1
+    out += ["#", "return", "MA5800-BENCH(config)#"]
+    return "\r\n".join(out[:n_lines])
+
+
+def best_of(func, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def chunked(text: str, size: int = 64 * 1024):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'linie':>10} {'MB':>7} {'dawny [s]':>11} {'nowy [s]':>10} {'fragmenty [s]':>14} {'przysp.':>8}")
+    for n in args.sizes:
+        text = make_config(n)
+        chunks = chunked(text)
+
+        expected = legacy_process_text(text)
+        assert process_text(text) == expected, "process_text różni się od dawnej implementacji!"
+        assert process_chunks(chunks) == expected, "process_chunks różni się od dawnej implementacji!"
+
+        t_old = best_of(legacy_process_text, text, args.repeat)
+        t_new = best_of(process_text, text, args.repeat)
+        t_chunks = best_of(process_chunks, chunks, args.repeat)
+
+        size_mb = len(text.encode("utf-8")) / 1024 / 1024
+        print(f"{n:>10} {size_mb:>7.1f} {t_old:>11.4f} {t_new:>10.4f} {t_chunks:>14.4f} {t_old / t_new:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
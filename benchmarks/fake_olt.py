@@ -0,0 +1,333 @@
+# benchmarks/fake_olt.py
+"""
+Symulator OLT po SSH (paramiko ServerInterface) do testów i benchmarków bez prawdziwych urządzeń.
+
+Jeden proces nasłuchuje na wybranym porcie na wszystkich adresach; urządzenie jest rozpoznawane
+po adresie lokalnym połączenia (127.0.x.y - cała sieć 127/8 trafia na interfejs loopback),
+więc N "urządzeń" to N adresów z tym samym SSH_PORT.
+
+Co symuluje:
+- prompty Huawei (MA5800>, #, (config)#, pytanie "{ <cr>|... }:") i ZTE (ZXAN#),
+- pager ("---- More ----" / "--More--") do czasu wyłączenia stronicowania,
+- opóźnienie odpowiedzi na każdą komendę i ograniczenie przepustowości,
+- duże konfiguracje (liczba linii),
+- niestabilne logowanie (odrzucanie hasła z zadanym prawdopodobieństwem),
+- zawieszenie po zalogowaniu albo w połowie wyniku.
+
+Uruchomienie (z katalogu głównego projektu):
+    python benchmarks/fake_olt.py --port 2222 --style huawei --config-lines 5000 --latency 0.05
+    python benchmarks/fake_olt.py --port 2222 --flaky 127.0.10.3 --hang 127.0.10.4
+Użycie: SSH_PORT=2222 i adresy urządzeń 127.0.10.1, 127.0.10.2, ... (patrz device_ip).
+"""
+import argparse
+import logging
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional
+
+import paramiko
+
+HUAWEI_PARAM_PROMPT = "{ <cr>|interface<K>|section<K>||<K> }:"
+HUAWEI_MORE = "  ---- More ( Press 'Q' to break ) ----"
+ZTE_MORE = " --More-- "
+
+# Porcja wysyłana przy ograniczonej przepustowości (bajty)
+SEND_CHUNK = 16 * 1024
+
+
+def device_ip(index: int) -> str:
+    """Adres i-tego symulowanego urządzenia (0, 1, ...): 127.0.10.1, ..., 127.0.10.250, 127.0.11.1, ..."""
+    return f"127.0.{10 + index // 250}.{index % 250 + 1}"
+
+
+@dataclass
+class OltProfile:
+    style: str = "huawei"  # huawei / zte
+    hostname: str = "MA5800-SIM"
+    config_lines: int = 2000
+    latency: float = 0.0  # opóźnienie odpowiedzi na komendę (s)
+    bandwidth: int = 0  # bajty/s, 0 = bez limitu
+    page_lines: int = 512  # długość strony pagera (0 = bez pagera)
+    auth_fail_rate: float = 0.0  # prawdopodobieństwo odrzucenia poprawnego hasła
+    hang: Optional[str] = None  # None / "login" / "output"
+    username: Optional[str] = None  # None = dowolne dane logowania
+    password: Optional[str] = None
+
+
+def config_lines(profile: OltProfile) -> Iterator[str]:
+    """Syntetyczna konfiguracja (ONT-y, interfejsy GPON) o zadanej liczbie linii."""
+    if profile.style == "zte":
+        yield "!"
+        yield f"hostname {profile.hostname}"
+    else:
+        yield "[MA5800-X15V100R019: 8034]"
+        yield "#"
+        yield f" sysname {profile.hostname}"
+    n = 3
+    i = 0
+    while n < profile.config_lines - 2:
+        if i % 500 == 0:
+            yield "#" if profile.style == "huawei" else "!"
+            yield f"interface gpon 0/{i % 16}"
+            n += 2
+        yield f' ont add 0 {i % 128} sn-auth "48575443{i:08X}" omci ont-lineprofile-id 10 ont-srvprofile-id 10'
+        n += 1
+        i += 1
+    yield "#" if profile.style == "huawei" else "!"
+    yield "return" if profile.style == "huawei" else "end"
+
+
+class _Interface(paramiko.ServerInterface):
+    def __init__(self, profile: OltProfile):
+        self.profile = profile
+        self.shell_requested = threading.Event()
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if self.profile.auth_fail_rate and random.random() < self.profile.auth_fail_rate:
+            return paramiko.AUTH_FAILED
+        if self.profile.username is not None and (username, password) != (self.profile.username, self.profile.password):
+            return paramiko.AUTH_FAILED
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.shell_requested.set()
+        return True
+
+
+class OltSession:
+    """Sesja CLI na jednym kanale SSH."""
+
+    def __init__(self, channel, profile: OltProfile):
+        self.channel = channel
+        self.profile = profile
+        self.mode = ">" if profile.style == "huawei" else "#"
+        self.paging = profile.page_lines > 0
+        self.inbuf = b""
+
+    def prompt(self) -> str:
+        return f"{self.profile.hostname}{self.mode}"
+
+    def send(self, text: str) -> None:
+        data = text.encode()
+        if not self.profile.bandwidth:
+            self.channel.sendall(data)
+            return
+        for offset in range(0, len(data), SEND_CHUNK):
+            chunk = data[offset:offset + SEND_CHUNK]
+            self.channel.sendall(chunk)
+            time.sleep(len(chunk) / self.profile.bandwidth)
+
+    def _read(self) -> bool:
+        data = self.channel.recv(4096)
+        if not data:
+            return False
+        self.inbuf += data
+        return True
+
+    def read_line(self) -> Optional[str]:
+        while b"\n" not in self.inbuf and b"\r" not in self.inbuf:
+            if not self._read():
+                return None
+        line, _, self.inbuf = self.inbuf.replace(b"\r\n", b"\n").replace(b"\r", b"\n").partition(b"\n")
+        return line.decode(errors="ignore")
+
+    def read_key(self) -> Optional[str]:
+        while not self.inbuf:
+            if not self._read():
+                return None
+        key, self.inbuf = self.inbuf[:1], self.inbuf[1:]
+        return key.decode(errors="ignore")
+
+    def wait_for_close(self) -> None:
+        while self._read():
+            pass
+
+    def run(self) -> None:
+        if self.profile.hang == "login":
+            self.wait_for_close()
+            return
+        self.send(f"\r\nWarning: simulated device {self.profile.hostname}\r\n\r\n{self.prompt()}")
+        while True:
+            line = self.read_line()
+            if line is None:
+                return
+            if self.profile.latency:
+                time.sleep(self.profile.latency)
+            if not self.handle(line.strip()):
+                return
+
+    def handle(self, command: str) -> bool:
+        """Odpowiedź na komendę. False = koniec sesji."""
+        self.send(command + "\r\n")
+        huawei = self.profile.style == "huawei"
+
+        if not command:
+            pass
+        elif command in ("quit", "exit", "logout"):
+            return False
+        elif huawei and command == "enable":
+            self.mode = "#"
+        elif huawei and command == "config":
+            self.mode = "(config)#"
+        elif huawei and command in ("mmi-mode original-output", "undo mmi-mode original-output"):
+            pass
+        elif (huawei and command in ("screen-length 0 temporary", "scroll")) or (not huawei and command == "terminal length 0"):
+            self.paging = False
+        elif huawei and command == "display current-configuration":
+            self.send(HUAWEI_PARAM_PROMPT)
+            if self.read_line() is None:
+                return False
+            self.send("\r\n  Command:\r\n          display current-configuration\r\n")
+            return self.send_output()
+        elif not huawei and command == "show running-config":
+            self.send("Building configuration...\r\n")
+            return self.send_output()
+        else:
+            self.send("                ^\r\n  % Unknown command, the error locates at '^'\r\n")
+
+        self.send(self.prompt())
+        return True
+
+    def send_output(self) -> bool:
+        lines = list(config_lines(self.profile))
+        if self.profile.hang == "output":
+            self.send("\r\n".join(lines[:len(lines) // 2]) + "\r\n")
+            self.wait_for_close()
+            return False
+
+        more = HUAWEI_MORE if self.profile.style == "huawei" else ZTE_MORE
+        page = self.profile.page_lines if self.paging else len(lines)
+        for offset in range(0, len(lines), page):
+            self.send("\r\n".join(lines[offset:offset + page]) + "\r\n")
+            if offset + page < len(lines):
+                self.send(more)
+                key = self.read_key()
+                if key is None:
+                    return False
+                # Urządzenie "zamazuje" napis More przed dalszym wynikiem
+                if self.profile.style == "huawei":
+                    self.send(f"\x1b[{len(more)}D" + " " * len(more) + f"\x1b[{len(more)}D")
+                else:
+                    self.send("\x08" * len(more))
+                if key in ("q", "Q"):
+                    break
+        self.send(self.prompt())
+        return True
+
+
+class FakeOltServer:
+    """Serwer SSH dla wielu symulowanych urządzeń (profil wybierany po adresie lokalnym połączenia)."""
+
+    def __init__(self, port: int = 2222, host: str = "",
+                 profile_for: Optional[Callable[[str], OltProfile]] = None) -> None:
+        self.profile_for = profile_for or (lambda ip: OltProfile())
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(1024)
+        self.port = self._sock.getsockname()[1]
+        self._stop = threading.Event()
+
+    def serve_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def start(self) -> "FakeOltServer":
+        threading.Thread(target=self.serve_forever, name="fake-olt", daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        self._sock.close()
+
+    def _handle(self, client: socket.socket) -> None:
+        profile = self.profile_for(client.getsockname()[0])
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        interface = _Interface(profile)
+        try:
+            transport.start_server(server=interface)
+            channel = transport.accept(timeout=30)
+            if channel is None or not interface.shell_requested.wait(10):
+                return
+            OltSession(channel, profile).run()
+        except (paramiko.SSHException, EOFError, OSError):
+            pass
+        finally:
+            transport.close()
+
+
+def build_profile_for(args) -> Callable[[str], OltProfile]:
+    flaky = set(args.flaky or [])
+    hang_login = set(args.hang or [])
+    hang_output = set(args.hang_output or [])
+    profiles: Dict[str, OltProfile] = {}
+
+    def profile_for(ip: str) -> OltProfile:
+        if ip not in profiles:
+            profiles[ip] = OltProfile(
+                style=args.style,
+                hostname=("MA5800-" if args.style == "huawei" else "ZXAN-") + ip.replace(".", "-"),
+                config_lines=args.config_lines,
+                latency=args.latency,
+                bandwidth=args.bandwidth,
+                page_lines=args.page_lines,
+                auth_fail_rate=args.flaky_rate if ip in flaky else 0.0,
+                hang="login" if ip in hang_login else ("output" if ip in hang_output else None),
+            )
+        return profiles[ip]
+
+    return profile_for
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Opcje symulatora - wspólne z benchmarks/bench_backup_e2e.py."""
+    parser.add_argument("--style", choices=("huawei", "zte"), default="huawei")
+    parser.add_argument("--config-lines", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0, help="opóźnienie odpowiedzi na komendę (s)")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bajty/s na sesję (0 = bez limitu)")
+    parser.add_argument("--page-lines", type=int, default=512, help="długość strony pagera (0 = bez pagera)")
+    parser.add_argument("--flaky-rate", type=float, default=0.5, help="odsetek odrzuconych logowań urządzeń --flaky")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Symulator OLT po SSH")
+    parser.add_argument("--port", type=int, default=2222)
+    add_arguments(parser)
+    parser.add_argument("--flaky", nargs="*", metavar="IP", help="urządzenia z niestabilnym logowaniem")
+    parser.add_argument("--hang", nargs="*", metavar="IP", help="urządzenia zawieszające się po zalogowaniu")
+    parser.add_argument("--hang-output", nargs="*", metavar="IP", help="urządzenia zawieszające się w połowie wyniku")
+    args = parser.parse_args()
+
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    server = FakeOltServer(port=args.port, profile_for=build_profile_for(args))
+    print(f"fake-olt: nasłuchuję na porcie {server.port} (styl {args.style})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
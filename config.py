@@ -19,6 +19,9 @@ else:
     data_dir = os.getenv("DATA_DIR", ".")
     db_path = os.path.join(data_dir, "app.db")
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+    # Przy równoległym backupie kilka wątków zapisuje do SQLite naraz -
+    # dłuższy timeout blokady zamiast natychmiastowego "database is locked".
+    SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 30}}
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
@@ -37,16 +40,109 @@ SESSION_PERMANENT = True
 PERMANENT_SESSION_LIFETIME = timedelta(minutes=10)
 
 BACKUP_ENCRYPTION_KEY = os.getenv("BACKUP_ENCRYPTION_KEY")
+# Poprzednie klucze (po przecinku) - tylko do odczytu starszych plików, nowe zawsze szyfruje BACKUP_ENCRYPTION_KEY.
+# Po "flask rotate-keys" można je usunąć.
+BACKUP_ENCRYPTION_OLD_KEYS = [k.strip() for k in os.getenv("BACKUP_ENCRYPTION_OLD_KEYS", "").split(",") if k.strip()]
+# Przeszyfrowanie katalogu backupów (flask rotate-keys): liczba wątków i limit I/O w MB/s (0 = bez limitu)
+KEY_ROTATION_WORKERS = max(1, int(os.getenv("KEY_ROTATION_WORKERS", 4)))
+KEY_ROTATION_MAX_MBPS = float(os.getenv("KEY_ROTATION_MAX_MBPS", 20))
+
+# Kompresja przed szyfrowaniem: zlib, lzma lub none. Poziom: zlib 0-9, lzma 0-9.
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "zlib").lower()
+BACKUP_COMPRESSION_LEVEL = int(os.getenv("BACKUP_COMPRESSION_LEVEL", 6))
+# Rozmiar ramki szyfrowania strumieniowego (bajty skompresowanej treści na ramkę)
+BACKUP_FRAME_SIZE = int(os.getenv("BACKUP_FRAME_SIZE", 64 * 1024))
 
 # === KONFIGURACJA BACKUPU ===
 MAX_BACKUPS_PER_DEVICE = int(os.getenv("MAX_BACKUPS_PER_DEVICE", 7))
 BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
 DEVICES_FILE = os.getenv("DEVICES_FILE", "devices.txt")
+# Sposób przechowywania: "full" - pełna kopia za każdym razem,
+# "delta" - pełny snapshot + delty liniowe względem niego (więcej historii w tym samym miejscu)
+BACKUP_STORAGE_MODE = os.getenv("BACKUP_STORAGE_MODE", "full").lower()
+# Ile delt może wskazywać na jeden snapshot, zanim zapiszemy kolejną pełną kopię
+BACKUP_DELTA_CHAIN_LENGTH = int(os.getenv("BACKUP_DELTA_CHAIN_LENGTH", 10))
+# Ile odszyfrowanych snapshotów bazowych trzymać w pamięci procesu
+DELTA_BASE_CACHE_SIZE = int(os.getenv("DELTA_BASE_CACHE_SIZE", 8))
+# Limit pamięci (bajty, na proces) na odszyfrowane backupy oglądane/pobierane w panelu; 0 = wyłączone
+DECRYPTED_CACHE_MAX_BYTES = int(os.getenv("DECRYPTED_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Linie pomijane przy porównywaniu konfiguracji (regex) - zmieniają się bez zmiany konfiguracji:
+# nagłówek Huawei z licznikiem "[MA5800-X15V100R019: 8034]" oraz znaczniki czasu.
+BACKUP_VOLATILE_PATTERN = os.getenv(
+    "BACKUP_VOLATILE_PATTERN",
+    r"^\s*\[[^\]]*:\s*\d+\]\s*$|\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}|^\s*!.*(last|updated|time)"
+)
+# Eksport ZIP najnowszych backupów: poziom kompresji ("store" = bez kompresji, 0-9 = deflate)
+# oraz liczba wątków odszyfrowujących kolejne pliki z wyprzedzeniem
+ZIP_EXPORT_LEVEL = os.getenv("ZIP_EXPORT_LEVEL", "6")
+ZIP_EXPORT_WORKERS = int(os.getenv("ZIP_EXPORT_WORKERS", 4))
+# Rotacja logs/app.log: rozmiar segmentu i liczba starych (skompresowanych .gz) segmentów
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 10))
+# Ile MB logów (od końca, łącznie z plikami po rotacji) przeszukać dla strony szczegółów urządzenia
+LOG_VIEWER_MAX_SCAN_MB = int(os.getenv("LOG_VIEWER_MAX_SCAN_MB", 64))
+# Dzierżawa uruchomienia backupu (wspólna dla panelu i crona): co ile sekund właściciel ją odświeża
+# i po ilu sekundach bez odświeżenia uznajemy ją za porzuconą (proces zabity) i można ją przejąć
+RUN_LEASE_HEARTBEAT_SECONDS = float(os.getenv("RUN_LEASE_HEARTBEAT_SECONDS", 5))
+RUN_LEASE_STALE_SECONDS = float(os.getenv("RUN_LEASE_STALE_SECONDS", 60))
+# Ile urządzeń backupujemy jednocześnie (1 = tryb sekwencyjny jak dawniej)
+BACKUP_MAX_WORKERS = max(1, int(os.getenv("BACKUP_MAX_WORKERS", 8)))
+# Kolejka zadań backupu (flask backup-worker): co ile sekund pusty worker sprawdza kolejkę
+BACKUP_WORKER_POLL_SECONDS = float(os.getenv("BACKUP_WORKER_POLL_SECONDS", 2))
+# Co ile sekund worker potwierdza, że wciąż wykonuje zadanie (heartbeat), i po ilu sekundach
+# bez potwierdzenia zadanie uznajemy za porzucone (worker zabity) - wraca wtedy do kolejki
+BACKUP_JOB_HEARTBEAT_SECONDS = float(os.getenv("BACKUP_JOB_HEARTBEAT_SECONDS", 30))
+BACKUP_JOB_STALE_SECONDS = float(os.getenv("BACKUP_JOB_STALE_SECONDS", 180))
+# Demon harmonogramu (cron_worker.py): co ile sekund sprawdza, czy zmieniono harmonogram
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 30))
+
+# Panel: liczba wierszy na stronie (lista urządzeń, historia backupów, użytkownicy)
+PAGE_SIZE = max(1, int(os.getenv("PAGE_SIZE", 100)))
+# Panel: strumień zmian statusu (SSE) - co ile sekund sprawdzać bazę (zmiany z kontenera cron)
+# i po ilu sekundach zamknąć połączenie (przeglądarka łączy się ponownie sama)
+STATUS_POLL_SECONDS = float(os.getenv("STATUS_POLL_SECONDS", 2))
+STATUS_STREAM_MAX_SECONDS = int(os.getenv("STATUS_STREAM_MAX_SECONDS", 300))
+# Panel: raport wydajności - z ilu ostatnich uruchomień i ile najwolniejszych urządzeń pokazać
+PERFORMANCE_REPORT_RUNS = max(1, int(os.getenv("PERFORMANCE_REPORT_RUNS", 10)))
+PERFORMANCE_REPORT_LIMIT = max(1, int(os.getenv("PERFORMANCE_REPORT_LIMIT", 20)))
 
 # === SSH ===
 SSH_USERNAME = os.getenv("SSH_USERNAME", "").strip()
 SSH_PASSWORD = os.getenv("SSH_PASSWORD", "")
 SSH_TIMEOUT = int(os.getenv("SSH_TIMEOUT", 20))
+# Port SSH urządzeń (inny niż 22 np. dla symulatora OLT z benchmarks/fake_olt.py)
+SSH_PORT = int(os.getenv("SSH_PORT", 22))
+# Twardy limit czasu na jedną komendę (sekundy)
+SSH_COMMAND_TIMEOUT = float(os.getenv("SSH_COMMAND_TIMEOUT", 300))
+# Okno ciszy kończące odczyt, gdy nie udało się rozpoznać promptu urządzenia
+SSH_QUIET_TIME = float(os.getenv("SSH_QUIET_TIME", 3))
+# Bezpiecznik przy rozpoznanym prompcie: tyle sekund bez danych = koniec odczytu
+SSH_IDLE_TIMEOUT = float(os.getenv("SSH_IDLE_TIMEOUT", 30))
+# Rozmiar pojedynczego odczytu z kanału SSH (bajty)
+SSH_RECV_SIZE = int(os.getenv("SSH_RECV_SIZE", 65536))
+# Komenda wyłączająca stronicowanie wysyłana po zalogowaniu.
+# "auto" = dobór po banerze i prompcie (Huawei/VRP/MA5600/MA5800 -> screen-length 0 temporary, potem scroll;
+# ZTE -> terminal length 0; nieznany producent -> najpierw VRP, przy odrzuceniu terminal length 0),
+# pusty ciąg = nie wysyłaj nic.
+SSH_DISABLE_PAGING_COMMAND = os.getenv("SSH_DISABLE_PAGING_COMMAND", "auto").strip()
+
+# Ponawianie połączenia: liczba prób i przerwa wykładnicza z losowym rozrzutem (sekundy)
+SSH_CONNECT_RETRIES = max(1, int(os.getenv("SSH_CONNECT_RETRIES", 3)))
+SSH_RETRY_BASE_DELAY = float(os.getenv("SSH_RETRY_BASE_DELAY", 2))
+SSH_RETRY_MAX_DELAY = float(os.getenv("SSH_RETRY_MAX_DELAY", 30))
+# Adaptacyjny timeout połączenia: średni czas logowania urządzenia * FACTOR, w granicach [MIN, SSH_TIMEOUT]
+SSH_CONNECT_TIMEOUT_FACTOR = float(os.getenv("SSH_CONNECT_TIMEOUT_FACTOR", 4))
+SSH_CONNECT_TIMEOUT_MIN = float(os.getenv("SSH_CONNECT_TIMEOUT_MIN", 5))
+# Circuit breaker: po tylu nieudanych połączeniach z rzędu urządzenie jest pomijane
+# przez COOLDOWN minut (podwajane przy każdej kolejnej porażce, najwyżej MAX_COOLDOWN)
+CIRCUIT_BREAKER_THRESHOLD = max(1, int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", 3)))
+CIRCUIT_BREAKER_COOLDOWN_MINUTES = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN_MINUTES", 60))
+CIRCUIT_BREAKER_MAX_COOLDOWN_MINUTES = float(os.getenv("CIRCUIT_BREAKER_MAX_COOLDOWN_MINUTES", 10080))
+# Pre-flight: przed backupem sprawdzamy naraz TCP/22 wszystkich urządzeń (timeout w sekundach,
+# liczba gniazd otwartych jednocześnie); nieosiągalne od razu dostają błąd
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT_ENABLED", "1").lower() in ("1", "true", "yes")
+PREFLIGHT_TIMEOUT = float(os.getenv("PREFLIGHT_TIMEOUT", 3))
+PREFLIGHT_MAX_SOCKETS = max(1, int(os.getenv("PREFLIGHT_MAX_SOCKETS", 256)))
 
 # === KOMENDY OLT ===
 COMMAND_1 = os.getenv("COMMAND_1")
@@ -56,5 +152,12 @@ COMMAND_4 = os.getenv("COMMAND_4")
 COMMAND_5 = os.getenv("COMMAND_5")
 COMMANDS = [COMMAND_1, COMMAND_2, COMMAND_3, COMMAND_4, COMMAND_5]
 
+# === METRYKI (Prometheus, /metrics) ===
+# Katalog współdzielony przez wszystkie procesy (workery gunicorna, kontener cron, backup-worker) -
+# /metrics sumuje liczniki ich wszystkich. Pusty = metryki tylko procesu, który obsłużył zapytanie.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "").strip()
+# Jeśli ustawiony, /metrics wymaga nagłówka "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 # === POWIADOMIENIA ===
 MATTERMOST_WEBHOOK_URL = os.getenv("MATTERMOST_WEBHOOK_URL", "")
\ No newline at end of file
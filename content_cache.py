@@ -0,0 +1,139 @@
+# content_cache.py
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, Optional
+
+import config
+import security_utils
+
+
+class DecryptedContentCache:
+    """
+    Cache LRU odszyfrowanej treści backupów - tylko w pamięci procesu, nigdy na dysku.
+    Klucz: (ścieżka, mtime_ns, rozmiar) - podmiana lub nadpisanie pliku samo unieważnia wpis.
+    Limit łącznego rozmiaru w bajtach (max_bytes) i/lub liczby wpisów (max_entries).
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # klucz -> wartość
+        self._sizes = {}  # klucz -> rozmiar w bajtach
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_entry_bytes(self) -> Optional[int]:
+        """Pojedynczy wpis nie może wypchnąć całej reszty cache."""
+        return self.max_bytes // 4 if self.max_bytes is not None else None
+
+    @staticmethod
+    def _key(path: Path):
+        st = path.stat()
+        return str(path), st.st_mtime_ns, st.st_size
+
+    def get(self, path: Path):
+        try:
+            key = self._key(path)
+        except OSError:
+            self.invalidate(path.name)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, path: Path, value, size: Optional[int] = None) -> None:
+        size = len(value) if size is None else size
+        if self.max_entry_bytes is not None and size > self.max_entry_bytes:
+            return
+        try:
+            key = self._key(path)
+        except OSError:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and (
+                (self.max_bytes is not None and self._bytes > self.max_bytes)
+                or (self.max_entries is not None and len(self._entries) > self.max_entries)):
+            key, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def invalidate(self, filename: str) -> None:
+        """Usuwa wszystkie wersje pliku o tej nazwie (po usunięciu/rotacji backupu)."""
+        with self._lock:
+            for key in [k for k in self._entries if Path(k[0]).name == filename]:
+                del self._entries[key]
+                self._bytes -= self._sizes.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+# Cache warstwy web (podgląd / pobieranie backupu) - jeden na proces
+web_cache = DecryptedContentCache(max_bytes=config.DECRYPTED_CACHE_MAX_BYTES)
+
+
+def iter_backup(path: Path) -> Iterator[bytes]:
+    """
+    Treść backupu porcjami (jak security_utils.iter_decrypted), z cache.
+    Przy chybieniu treść jest strumieniowana i - jeśli zmieści się w limicie
+    wpisu i odczyt się powiódł - odkładana do cache dla kolejnych wyświetleń.
+    """
+    cached = web_cache.get(path)
+    if cached is not None:
+        yield cached
+        return
+
+    limit = web_cache.max_entry_bytes
+    parts = []
+    size = 0
+    for chunk in security_utils.iter_decrypted(path):
+        if parts is not None:
+            parts.append(chunk)
+            size += len(chunk)
+            if limit is not None and size > limit:
+                parts = None  # za duże do cache - tylko strumieniujemy
+        yield chunk
+
+    if parts is not None:
+        content = b"".join(parts)
+        if not content.startswith(security_utils.READ_ERROR_PREFIX.encode("utf-8")):
+            web_cache.put(path, content)
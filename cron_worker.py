@@ -1,44 +1,107 @@
 # cron_worker.py
+"""
+Demon harmonogramu (kontener cron).
+
+Jeden długo działający proces zamiast uruchamiania skryptu co minutę: kontekst aplikacji
+i połączenie z bazą są przygotowane raz, proces śpi do najbliższego terminu backupu,
+a harmonogram czyta ponownie tylko po zmianie jego wersji w tabeli Settings
+(sprawdzanej co SCHEDULER_POLL_SECONDS). SIGTERM kończy demona - trwający backup
+jest anulowany (rozpoczęte urządzenia są dokańczane), a dzierżawa zwalniana.
+"""
 from datetime import datetime
-import time
+import signal
+import threading
 
+import config
+import metrics
+from extensions import db
 from logger_conf import logger
 from backup_service import BackupService
-from schedule import ScheduleService, should_run_now
+from schedule import ScheduleService, should_run_now, next_run_time
 # Import app, aby mieć kontekst bazy danych
 from webapp import app
 
 
-def main() -> None:
-    # Worker potrzebuje kontekstu aplikacji (Flask), aby połączyć się z bazą danych
-    with app.app_context():
-        try:
-            # 1. Pobierz harmonogram z BAZY
-            schedule = ScheduleService.load_schedule()
-            now = datetime.now()
+class SchedulerDaemon:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.service = BackupService(flask_app)
+        self.stop = threading.Event()
+        self.schedule = None
+        self.version = None
+
+    def handle_signal(self, signum, frame):
+        logger.info("Auto-backup: otrzymano sygnał zakończenia - zatrzymuję demona harmonogramu.")
+        self.stop.set()
+        self.service.cancel_local_run()
+
+    def _refresh_schedule(self) -> None:
+        version = ScheduleService.get_version()
+        if self.schedule is not None and version == self.version:
+            return
+        self.schedule = ScheduleService.load_schedule()
+        self.version = version
+        logger.info(f"Auto-backup: wczytano harmonogram (włączony: {self.schedule.enabled}, "
+                    f"godzina {self.schedule.hour:02d}:{self.schedule.minute:02d}).")
 
-            # 2. Sprawdź czy uruchamiać
-            if not should_run_now(schedule, now):
-                # Opcjonalnie: logger.debug, żeby nie śmiecić w logach co minutę
-                # logger.debug("Auto-backup: brak potrzeby uruchamiania.")
-                return
+    def _run_backup(self, now: datetime) -> bool:
+        """False = backup nie ruszył (dzierżawę trzyma inny proces) - dzień zostaje do wykonania."""
+        logger.info("Auto-backup: HARMONOGRAM ZADZIAŁAŁ. Start backupu.")
+        if not self.service.backup_devices_logic(trigger_type='cron'):
+            logger.warning(f"Auto-backup: trwa inny backup - ponowna próba za {config.SCHEDULER_POLL_SECONDS:.0f} s.")
+            return False
+        if self.stop.is_set():
+            # Przerwany przez zatrzymanie kontenera - po restarcie backup ruszy ponownie
+            logger.info("Auto-backup: backup przerwany przy zamykaniu - nie zapisuję daty wykonania.")
+            return True
 
-            logger.info("Auto-backup: HARMONOGRAM ZADZIAŁAŁ. Start backupu.")
+        # Zapisz datę wykonania, żeby nie uruchomić ponownie dzisiaj
+        today_str = now.date().isoformat()
+        ScheduleService.update_last_run_date(today_str)
+        self.schedule.last_run_date = today_str
+        logger.info(f"Auto-backup: Zakończono. Ustawiono last_run_date na {today_str}")
+        return True
 
-            # 3. Uruchom usługę backupu
-            service = BackupService(app)
-            service.backup_devices_logic(trigger_type='cron')
+    def _seconds_to_wait(self, now: datetime) -> float:
+        due = next_run_time(self.schedule, now)
+        if due is None:
+            return config.SCHEDULER_POLL_SECONDS
+        return max(0.0, min(config.SCHEDULER_POLL_SECONDS, (due - now).total_seconds()))
 
-            # 4. Zapisz datę wykonania, żeby nie uruchomić ponownie dzisiaj
-            today_str = now.date().isoformat()
-            ScheduleService.update_last_run_date(today_str)
-            logger.info(f"Auto-backup: Zakończono. Ustawiono last_run_date na {today_str}")
+    def run(self) -> None:
+        logger.info("Auto-backup: demon harmonogramu uruchomiony.")
+        # Worker potrzebuje kontekstu aplikacji (Flask), aby połączyć się z bazą danych
+        with self.app.app_context():
+            while not self.stop.is_set():
+                try:
+                    self._refresh_schedule()
+                    now = datetime.now()
+                    if should_run_now(self.schedule, now):
+                        if self._run_backup(now):
+                            # Nie trzymamy obiektów z całego uruchomienia w sesji do następnego dnia
+                            db.session.remove()
+                            continue
+                        # Backup innego procesu (ręczny albo dzierżawa, która jeszcze nie wygasła)
+                        wait = config.SCHEDULER_POLL_SECONDS
+                    else:
+                        wait = self._seconds_to_wait(now)
+                except Exception as e:
+                    logger.error(f"Krytyczny błąd w cron_worker: {e}")
+                    wait = config.SCHEDULER_POLL_SECONDS
+
+                # Bez otwartej transakcji na czas snu (SQLite: nie blokujemy zapisów innych procesów)
+                db.session.rollback()
+                self.stop.wait(wait)
+        logger.info("Auto-backup: demon harmonogramu zatrzymany.")
+
+
+def main() -> None:
+    metrics.remove_dead_process_files()
+    daemon = SchedulerDaemon(app)
+    signal.signal(signal.SIGTERM, daemon.handle_signal)
+    signal.signal(signal.SIGINT, daemon.handle_signal)
+    daemon.run()
 
-        except Exception as e:
-            logger.error(f"Krytyczny błąd w cron_worker: {e}")
 
 if __name__ == "__main__":
-    # Jeśli uruchamiasz to w pętli w systemie (np. co minutę), to wystarczy raz.
-    # Jeśli to ma być demon (działający w tle ciągle), trzeba by dodać pętlę while True.
-    # Zakładam, że uruchamiasz to z systemowego crona co minutę lub jako oddzielny proces.
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,95 @@
+# delta_storage.py
+"""
+Delty liniowe konfiguracji względem pełnej kopii bazowej (snapshotu).
+
+Format delty (tekst, szyfrowany tak samo jak zwykły backup):
+    #OLT-DELTA/1 <plik_bazowy> <sha256 wyniku>
+    =<od> <do>        -> skopiuj linie bazy [od, do)
+    +<n>              -> wstaw n kolejnych linii delty
+    <linia 1>
+    ...
+Delta zawsze odnosi się bezpośrednio do snapshotu (nie do poprzedniej delty),
+więc odtworzenie dowolnej wersji to: baza + jedna delta.
+"""
+import difflib
+import hashlib
+from typing import List
+
+DELTA_MAGIC = "#OLT-DELTA/1 "
+
+
+class DeltaError(ValueError):
+    """Uszkodzona delta lub niepasująca baza."""
+
+
+def _split(text: str) -> List[str]:
+    # split("\n") zamiast splitlines() - odtworzenie musi być bajt w bajt
+    return text.split("\n")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_delta(text: str) -> bool:
+    return text.startswith(DELTA_MAGIC)
+
+
+def delta_base_filename(delta_text: str) -> str:
+    header = delta_text.split("\n", 1)[0]
+    try:
+        return header[len(DELTA_MAGIC):].split(" ")[0]
+    except IndexError:
+        raise DeltaError("Brak nazwy pliku bazowego w nagłówku delty")
+
+
+def encode_delta(base_text: str, new_text: str, base_filename: str) -> str:
+    """Zwraca deltę, która z base_text odtwarza new_text."""
+    base_lines = _split(base_text)
+    new_lines = _split(new_text)
+
+    out = [f"{DELTA_MAGIC}{base_filename} {_digest(new_text)}"]
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            out.append(f"={i1} {i2}")
+        elif tag in ("replace", "insert"):
+            out.append(f"+{j2 - j1}")
+            out.extend(new_lines[j1:j2])
+        # "delete" - linii bazy po prostu nie kopiujemy
+    return "\n".join(out)
+
+
+def apply_delta(base_text: str, delta_text: str) -> str:
+    """Odtwarza pełną konfigurację z bazy i delty. Weryfikuje sumę kontrolną."""
+    lines = _split(delta_text)
+    header = lines[0]
+    if not header.startswith(DELTA_MAGIC):
+        raise DeltaError("To nie jest plik delty")
+
+    parts = header[len(DELTA_MAGIC):].split(" ")
+    expected_digest = parts[1] if len(parts) > 1 else None
+
+    base_lines = _split(base_text)
+    result = []
+    pos = 1
+    try:
+        while pos < len(lines):
+            op = lines[pos]
+            pos += 1
+            if op.startswith("="):
+                start, end = op[1:].split(" ")
+                result.extend(base_lines[int(start):int(end)])
+            elif op.startswith("+"):
+                count = int(op[1:])
+                result.extend(lines[pos:pos + count])
+                pos += count
+            else:
+                raise DeltaError(f"Nieznana operacja delty: {op[:20]!r}")
+    except ValueError as e:
+        raise DeltaError(f"Uszkodzona delta: {e}")
+
+    text = "\n".join(result)
+    if expected_digest and _digest(text) != expected_digest:
+        raise DeltaError("Suma kontrolna odtworzonej konfiguracji nie zgadza się (zmieniona baza?)")
+    return text
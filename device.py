@@ -1,14 +1,109 @@
 # device.py
+import codecs
+import random
+import re
 import time
 import socket
-from typing import List, Tuple, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, Optional, Pattern, Union
 
 import paramiko
 
-from text_processing import process_text
+from text_processing import process_chunks
 from logger_conf import logger
 import config
 
+# Najkrótsze oczekiwanie na dane w jednym recv (sekundy) - recv blokuje do nadejścia danych
+MIN_RECV_WAIT = 0.05
+
+# Ile ostatnich bajtów bufora przeszukujemy w poszukiwaniu początku ostatniej linii
+TAIL_WINDOW = 4096
+
+# Rozmiar porcji przy dekodowaniu bufora do tekstu
+DECODE_CHUNK_SIZE = 256 * 1024
+
+# Typowe prompty OLT/switchy: <sysname>, [sysname], sysname>, sysname#, sysname(config)#
+GENERIC_PROMPT_RE = re.compile(r"^[<\[]?([\w.\-/:@]+?)(?:\([^)]*\))?[>#\]]\s*$")
+
+# Huawei dopytuje o parametry komendy: "{ <cr>|ont<K>|... }:" - odpowiadamy Enterem
+PARAM_PROMPT_RE = re.compile(r"\{[^{}]*\}:\s*$")
+
+
+# Pager: "---- More ( Press 'Q' to break ) ----" (Huawei), "--More--" (ZTE/Cisco)
+MORE_PROMPT_RE = re.compile(r"-+ *More\b[^\n]*?-+ *$", re.IGNORECASE)
+
+# Ślad pagera w strumieniu: sam napis More oraz sekwencje, którymi urządzenie
+# go "zamazuje" po naciśnięciu spacji (ESC[nD + spacje albo backspace'y).
+# Działa na surowych bajtach, zanim wynik zostanie zdekodowany.
+PAGER_ARTIFACT_RE = re.compile(
+    rb"(?:(?<=\n) +)?-+ *More\b[^\n]*?-+ *(?:(?:\x1b\[\d*D)+ *(?:\x1b\[\d*D)*|\x08+ *\x08*)?",
+    re.IGNORECASE
+)
+ANSI_ESCAPE_RE = re.compile(rb"\x1b\[[0-9;?]*[A-Za-z]|\x08")
+
+# Komendy wyłączające stronicowanie
+PAGING_COMMAND_VRP = "screen-length 0 temporary"   # Huawei VRP (<sysname>) i OLT MA5600/MA5800
+PAGING_COMMAND_HUAWEI_OLT = "scroll"               # starsze oprogramowanie OLT Huawei
+PAGING_COMMAND_DEFAULT = "terminal length 0"       # ZTE, Cisco-like
+
+# Producent rozpoznawany po banerze powitalnym i prompcie (np. "MA5800-X15>", "ZXAN#")
+HUAWEI_BANNER_RE = re.compile(r"huawei|\bVRP\b|\b(?:MA56|MA58|EA58)\d\d", re.IGNORECASE)
+ZTE_BANNER_RE = re.compile(r"\bZTE\b|\bZXAN\b|\bZXA10\b", re.IGNORECASE)
+
+# Odpowiedź urządzenia na nieznaną komendę (Huawei "% Unknown command", ZTE/Cisco "% Invalid input")
+COMMAND_REJECTED_RE = re.compile(r"%\s*(?:Unknown command|Unrecognized command|Invalid input|Incomplete command)|"
+                                 r"\bError:\s*(?:Unrecognized|Wrong parameter)", re.IGNORECASE)
+
+
+def strip_pager_artifacts(data: Union[bytes, bytearray]) -> bytes:
+    """Usuwa z wyniku napisy More i sekwencje sterujące terminala."""
+    return ANSI_ESCAPE_RE.sub(b"", PAGER_ARTIFACT_RE.sub(b"", data))
+
+
+def iter_decoded(data: Union[bytes, bytearray], chunk_size: int = DECODE_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Dekoduje bufor UTF-8 porcjami (memoryview - bez kopiowania bufora).
+    Dekoder przyrostowy skleja znaki wielobajtowe rozcięte na granicy porcji.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        text = decoder.decode(view[offset:offset + chunk_size])
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def decode_output(data: Union[bytes, bytearray]) -> str:
+    return "".join(iter_decoded(data))
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Przerwa przed kolejną próbą połączenia: wykładnicza (SSH_RETRY_BASE_DELAY * 2^(n-1),
+    najwyżej SSH_RETRY_MAX_DELAY) z losowym rozrzutem ("full jitter"), żeby równoległe
+    wątki nie ponawiały połączeń w tym samym momencie.
+    """
+    ceiling = min(config.SSH_RETRY_MAX_DELAY, config.SSH_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+@contextmanager
+def phase_timer(timings: Dict[str, float], name: str):
+    """Dolicza czas bloku do timings[name] (sekundy) - także gdy blok zakończy się wyjątkiem."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.monotonic() - started
+
+
+def build_prompt_re(base: str) -> Pattern:
+    """Regex promptu konkretnego urządzenia - z dowolnym trybem, np. 'MA5800(config)#'."""
+    return re.compile(rf"^[<\[]?{re.escape(base)}(?:\([^)]*\))?[>#\]]\s*$")
+
 
 class Device:
     """
@@ -17,47 +112,83 @@ class Device:
     Nie zapisuje plików na dysku.
     """
 
-    def __init__(self, ip: str, username: str, password: str, commands: List[str]) -> None:
+    def __init__(self, ip: str, username: str, password: str, commands: List[str],
+                 connect_timeout: Optional[float] = None, max_retries: Optional[int] = None) -> None:
         self.ip = ip
         self.username = username
         self.password = password
         self.commands = commands
 
+        # Parametry połączenia (BackupService dobiera je do stanu urządzenia - device_health.py)
+        self.connect_timeout = connect_timeout or config.SSH_TIMEOUT
+        self.max_retries = max_retries or config.SSH_CONNECT_RETRIES
+        # Pomiary udanego połączenia: RTT gniazda TCP i czas do rozpoznania promptu
+        self.rtt_ms: Optional[float] = None
+        self.connect_seconds: Optional[float] = None
+        self.attempts: int = 0
+
+        # Czas poszczególnych faz w sekundach, w kolejności wykonania:
+        # tcp_connect, ssh_auth, shell_setup, retry_wait, cmd_<n>, processing
+        self.timings: Dict[str, float] = {}
+
         self.client: Optional[paramiko.SSHClient] = None
         self.channel = None
 
         self.outputs = {}  # type: dict[int, str]
         self.sysname: str = ""
 
+        # Prompt urządzenia rozpoznany po zalogowaniu (None = tryb "okna ciszy")
+        self.prompt_base: str = ""
+        self.prompt_line: str = ""
+        self._prompt_re: Optional[Pattern] = None
+        # Koniec banera powitalnego - rozpoznanie producenta (komenda wyłączająca stronicowanie)
+        self.banner: str = ""
+
+        # Ile razy pager zatrzymał wynik (0 = stronicowanie skutecznie wyłączone)
+        self.pager_pages: int = 0
+
+        # Liczniki odebranych bajtów: cała sesja oraz wynik każdej komendy
+        self.bytes_received: int = 0
+        self.output_bytes = {}  # type: dict[int, int]
+
     def connect(self) -> None:
         logger.info(f"Łączenie z urządzeniem: {self.ip} jako użytkownik {self.username}")
 
-        # USTAWIENIA PONAWIANIA
-        max_retries = 3  # Ile razy próbować
-        retry_delay = 10  # Ile sekund czekać między próbami
-
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.client.load_system_host_keys()
 
-        last_exception = None
-
-        for attempt in range(1, max_retries + 1):
+        for attempt in range(1, self.max_retries + 1):
+            started = time.monotonic()
+            self.attempts = attempt
             try:
                 if attempt > 1:
-                    logger.info(f"--> [RETRY] Ponawiam połączenie z {self.ip} (Próba {attempt}/{max_retries})...")
+                    logger.info(f"--> [RETRY] Ponawiam połączenie z {self.ip} (Próba {attempt}/{self.max_retries})...")
 
-                self.client.connect(
-                    self.ip,
-                    username=self.username,
-                    password=self.password,
-                    timeout=config.SSH_TIMEOUT,
-                    allow_agent=False,
-                    look_for_keys=False
-                )
+                # Gniazdo otwieramy sami, żeby zmierzyć czas samego połączenia TCP (RTT)
+                with phase_timer(self.timings, "tcp_connect"):
+                    sock = socket.create_connection((self.ip, config.SSH_PORT), timeout=self.connect_timeout)
+                self.rtt_ms = (time.monotonic() - started) * 1000
+                try:
+                    with phase_timer(self.timings, "ssh_auth"):
+                        self.client.connect(
+                            self.ip,
+                            username=self.username,
+                            password=self.password,
+                            timeout=self.connect_timeout,
+                            sock=sock,
+                            allow_agent=False,
+                            look_for_keys=False
+                        )
+                except Exception:
+                    sock.close()
+                    raise
 
-                self.channel = self.client.invoke_shell()
-                time.sleep(1)
+                with phase_timer(self.timings, "shell_setup"):
+                    self.channel = self.client.invoke_shell()
+                    self._learn_prompt()
+                    self.connect_seconds = time.monotonic() - started
+                    self._disable_paging()
 
                 # Jeśli dotarliśmy tutaj, to sukces - wychodzimy z funkcji connect
                 if attempt > 1:
@@ -65,48 +196,150 @@ class Device:
                 return
 
             except (paramiko.AuthenticationException, paramiko.SSHException, socket.error) as e:
-                last_exception = e
                 logger.warning(f"Błąd przy próbie {attempt} dla {self.ip}: {e}")
 
                 # Jeśli to nie była ostatnia próba, czekamy i pętla leci dalej
-                if attempt < max_retries:
-                    time.sleep(retry_delay)
+                if attempt < self.max_retries:
+                    with phase_timer(self.timings, "retry_wait"):
+                        time.sleep(retry_delay(attempt))
                 else:
                     # To była ostatnia próba - poddajemy się
-                    logger.error(f"Krytyczny błąd połączenia z {self.ip} po {max_retries} próbach.")
-                    raise last_exception
+                    logger.error(f"Krytyczny błąd połączenia z {self.ip} po {self.max_retries} próbach.")
+                    raise
 
-    def execute_command(self, command: str) -> str:
+    def _learn_prompt(self) -> None:
+        """
+        Czyta baner powitalny do pojawienia się pierwszego promptu
+        i na jego podstawie buduje regex końca wyniku komendy.
+        """
+        banner = self._read_until_prompt(GENERIC_PROMPT_RE, config.SSH_QUIET_TIME, config.SSH_TIMEOUT)
+        self.banner = bytes(banner[-TAIL_WINDOW:]).decode("utf-8", errors="ignore")
+        last_line = self._last_line(banner).strip()
+        match = GENERIC_PROMPT_RE.search(last_line)
+
+        if match:
+            self.prompt_line = last_line
+            self.prompt_base = match.group(1)
+            self._prompt_re = build_prompt_re(self.prompt_base)
+            logger.debug(f"{self.ip}: rozpoznany prompt '{last_line}'")
+        else:
+            self.prompt_base = ""
+            self.prompt_line = ""
+            self._prompt_re = None
+            logger.debug(f"{self.ip}: nie rozpoznano promptu - koniec wyniku po {config.SSH_QUIET_TIME}s ciszy")
+
+    def _paging_commands(self) -> List[str]:
+        """
+        Kandydaci na komendę wyłączającą stronicowanie, w kolejności prób.
+        "auto": producent z banera/promptu; gdy nieznany - najpierw VRP, potem terminal length 0.
+        """
+        command = config.SSH_DISABLE_PAGING_COMMAND
+        if command.lower() != "auto":
+            return [command] if command else []
+        if HUAWEI_BANNER_RE.search(self.banner) or self.prompt_line.startswith("<"):
+            return [PAGING_COMMAND_VRP, PAGING_COMMAND_HUAWEI_OLT]
+        if ZTE_BANNER_RE.search(self.banner):
+            return [PAGING_COMMAND_DEFAULT]
+        return [PAGING_COMMAND_VRP, PAGING_COMMAND_DEFAULT]
+
+    def _disable_paging(self) -> None:
+        """
+        Wyłącza stronicowanie na czas sesji: wysyła kolejnych kandydatów, aż urządzenie
+        przyjmie komendę. Gdy żadna nie przejdzie, pozostałe strony przewinie _read_until_prompt.
+        """
+        for command in self._paging_commands():
+            logger.debug(f"{self.ip}: wyłączam stronicowanie: {command}")
+            if not COMMAND_REJECTED_RE.search(self.execute_command(command)):
+                return
+            logger.debug(f"{self.ip}: urządzenie odrzuciło komendę '{command}'")
+
+    @staticmethod
+    def _last_line(buf: Union[bytes, bytearray]) -> str:
+        """Ostatnia (niezakończona znakiem nowej linii) linia bufora jako tekst."""
+        newline = buf.rfind(b"\n", max(0, len(buf) - TAIL_WINDOW))
+        start = newline + 1 if newline >= 0 else max(0, len(buf) - TAIL_WINDOW)
+        return bytes(buf[start:]).decode("utf-8", errors="ignore")
+
+    def _read_until_prompt(self, prompt_re: Optional[Pattern], quiet_time: float, timeout: float) -> bytearray:
+        """
+        Odczytuje kanał do momentu, gdy:
+          - ostatnia (niezakończona) linia pasuje do promptu,
+          - przez quiet_time sekund nie przyszły żadne dane,
+          - minie twardy limit timeout.
+        Po drodze odpowiada Enterem na pytania o parametry komendy (Huawei "{ <cr>|... }:")
+        i spacją na pager ("---- More ----"), a ślady pagera usuwa z wyniku.
+        Zwraca surowe bajty - dekodowanie odbywa się raz, na końcu.
+        """
+        buf = bytearray()
+        recv_size = config.SSH_RECV_SIZE
+        start = last_data = time.monotonic()
+        answered_at = -1
+        pages = 0
+
+        while True:
+            now = time.monotonic()
+            if now - start >= timeout:
+                logger.warning(f"{self.ip}: przekroczono limit {timeout}s oczekiwania na wynik")
+                break
+            if now - last_data >= quiet_time:
+                break
+
+            # recv blokuje do nadejścia danych (odpowiedź na spację pagera odbieramy od razu),
+            # najdłużej do końca okna ciszy albo limitu czasu
+            self.channel.settimeout(max(MIN_RECV_WAIT, min(quiet_time - (now - last_data), timeout - (now - start))))
+            try:
+                chunk = self.channel.recv(recv_size)
+            except socket.timeout:
+                continue
+            if not chunk:
+                break  # Kanał zamknięty przez urządzenie
+
+            buf += chunk
+            self.bytes_received += len(chunk)
+            last_data = time.monotonic()
+            tail = self._last_line(buf)
+
+            if MORE_PROMPT_RE.search(tail):
+                self.channel.send(" ")
+                pages += 1
+                continue
+            if prompt_re and prompt_re.search(tail):
+                break
+            if PARAM_PROMPT_RE.search(tail) and answered_at != len(buf):
+                self.channel.send("\n")
+                answered_at = len(buf)
+
+        if pages:
+            self.pager_pages += pages
+            logger.debug(f"{self.ip}: pager przewinięty {pages} razy")
+            buf = bytearray(strip_pager_artifacts(buf))
+        return buf
+
+    def execute_command_raw(self, command: str) -> bytearray:
+        """Wysyła komendę i zwraca surowy (niezdekodowany) wynik."""
         if not command:
-            return ""
+            return bytearray()
 
         logger.debug(f"{self.ip}: wykonuję komendę: {command}")
         self.channel.send(command + "\n")
-        time.sleep(1)
-        self.channel.send("\n")
-        time.sleep(1)
 
-        output = ""
-        while True:
-            if self.channel.recv_ready():
-                try:
-                    chunk = self.channel.recv(1024).decode(errors='ignore')
-                    output += chunk
-                except socket.timeout:
-                    break
-            else:
-                time.sleep(3)
-                if not self.channel.recv_ready():
-                    break
-        return output
+        # Z rozpoznanym promptem kończymy od razu po jego powrocie;
+        # okno ciszy jest wtedy tylko bezpiecznikiem na wypadek zmiany promptu.
+        quiet_time = config.SSH_IDLE_TIMEOUT if self._prompt_re else config.SSH_QUIET_TIME
+        return self._read_until_prompt(self._prompt_re, quiet_time, config.SSH_COMMAND_TIMEOUT)
+
+    def execute_command(self, command: str) -> str:
+        return decode_output(self.execute_command_raw(command))
 
     def run_commands(self) -> None:
         for i, cmd in enumerate(self.commands, start=1):
             if not cmd:
                 continue
-            raw_output = self.execute_command(cmd)
-            processed_output = process_text(raw_output)
-            self.outputs[i] = processed_output
+            with phase_timer(self.timings, f"cmd_{i}"):
+                raw_output = self.execute_command_raw(cmd)
+            self.output_bytes[i] = len(raw_output)
+            with phase_timer(self.timings, "processing"):
+                self.outputs[i] = process_chunks(iter_decoded(raw_output))
 
         self._determine_sysname()
 
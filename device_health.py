@@ -0,0 +1,72 @@
+# device_health.py
+"""
+Stan połączenia z urządzeniem zapisany w bazie (kolumny Device: consecutive_failures,
+last_rtt_ms, avg_connect_seconds, avg_backup_seconds, circuit_open_until) i decyzje podejmowane na jego podstawie:
+- timeout połączenia dopasowany do tego, ile urządzenie zwykle potrzebuje na zalogowanie,
+- liczba prób: pełna dla zdrowego urządzenia, jedna po wcześniejszej porażce,
+- circuit breaker: po CIRCUIT_BREAKER_THRESHOLD porażkach z rzędu urządzenie jest pomijane
+  przez czas, który podwaja się z każdą kolejną porażką (do CIRCUIT_BREAKER_MAX_COOLDOWN_MINUTES).
+  Po upływie tego czasu następuje jedna próba - sukces zamyka obwód.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+import config
+import metrics
+from logger_conf import logger
+
+# Waga nowego pomiaru w średniej kroczącej czasu logowania
+EWMA_ALPHA = 0.3
+
+
+def is_circuit_open(db_dev, now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    return db_dev.circuit_open_until is not None and db_dev.circuit_open_until > now
+
+
+def connect_timeout(db_dev) -> float:
+    """Timeout połączenia: wielokrotność średniego czasu logowania, w granicach [SSH_CONNECT_TIMEOUT_MIN, SSH_TIMEOUT]."""
+    if not db_dev.avg_connect_seconds:
+        return config.SSH_TIMEOUT
+    adaptive = db_dev.avg_connect_seconds * config.SSH_CONNECT_TIMEOUT_FACTOR
+    return max(config.SSH_CONNECT_TIMEOUT_MIN, min(config.SSH_TIMEOUT, adaptive))
+
+
+def connect_attempts(db_dev) -> int:
+    """Urządzenie, które ostatnio zawiodło, dostaje jedną próbę - nie czekamy na nie kilka razy każdej nocy."""
+    return 1 if db_dev.consecutive_failures else config.SSH_CONNECT_RETRIES
+
+
+def record_success(db_dev, connect_seconds: float, rtt_ms: Optional[float]) -> None:
+    """Udane połączenie: zeruje licznik porażek, zamyka obwód, aktualizuje średnią."""
+    if db_dev.circuit_open_until is not None or db_dev.consecutive_failures:
+        logger.info(f"{db_dev.ip}: połączenie przywrócone po {db_dev.consecutive_failures} porażkach")
+    db_dev.consecutive_failures = 0
+    db_dev.circuit_open_until = None
+    db_dev.last_rtt_ms = rtt_ms
+    if db_dev.avg_connect_seconds is None:
+        db_dev.avg_connect_seconds = connect_seconds
+    else:
+        db_dev.avg_connect_seconds += EWMA_ALPHA * (connect_seconds - db_dev.avg_connect_seconds)
+
+
+def record_failure(db_dev, now: Optional[datetime] = None) -> None:
+    """Nieudane połączenie: zwiększa licznik i ewentualnie otwiera obwód."""
+    now = now or datetime.now()
+    db_dev.consecutive_failures = (db_dev.consecutive_failures or 0) + 1
+    over = db_dev.consecutive_failures - config.CIRCUIT_BREAKER_THRESHOLD
+    if over < 0:
+        return
+    minutes = min(config.CIRCUIT_BREAKER_COOLDOWN_MINUTES * 2 ** over, config.CIRCUIT_BREAKER_MAX_COOLDOWN_MINUTES)
+    db_dev.circuit_open_until = now + timedelta(minutes=minutes)
+    metrics.CIRCUIT_TRIPS.inc()
+    logger.warning(f"{db_dev.ip}: {db_dev.consecutive_failures} nieudanych połączeń z rzędu - "
+                   f"pomijam do {db_dev.circuit_open_until.strftime('%Y-%m-%d %H:%M')}")
+
+
+def record_backup_duration(db_dev, seconds: float) -> None:
+    """Średnia krocząca czasu całego backupu - kolejność urządzeń w następnym uruchomieniu."""
+    if db_dev.avg_backup_seconds is None:
+        db_dev.avg_backup_seconds = seconds
+    else:
+        db_dev.avg_backup_seconds += EWMA_ALPHA * (seconds - db_dev.avg_backup_seconds)
@@ -15,6 +15,9 @@ python -m flask --app webapp update-schema
 
 # Uruchom serwer produkcyjny Gunicorn
 # -w 4 : 4 procesy (workerów)
+# -k gthread --threads 16 : wątki w każdym workerze - otwarte strumienie statusu (SSE)
+#                           nie mogą zajmować całych procesów
 # -b 0.0.0.0:5000 : nasłuchuj na porcie 5000
+# -c gunicorn.conf.py : hooki (metryki Prometheus zakończonych workerów)
 echo "--> Start serwera Gunicorn..."
-exec gunicorn -w 4 -b 0.0.0.0:5000 webapp:app
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 webapp:app
\ No newline at end of file
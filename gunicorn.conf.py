@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Hooki gunicorna (parametry uruchomienia: entrypoint.sh). Metryki workerów - patrz metrics.py.
+# Master nie importuje metrics ani logger_conf: wątek logowania uruchomiony przed fork()
+# nie istniałby w workerach - tylko metrics_files (bez logowania).
+import os
+import sys
+
+# Moduły aplikacji leżą obok tego pliku (gunicorn nie musi być uruchomiony z tego katalogu)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics_files  # noqa: E402
+
+
+def on_starting(server):
+    # Pliki metryk procesów z poprzedniego uruchomienia kontenera (w tym komend flask z entrypoint.sh)
+    metrics_files.remove_dead_process_files()
+
+
+def child_exit(server, worker):
+    # Zakończony worker nie może dalej zawyżać wskazań "w toku" na /metrics
+    metrics_files.mark_process_dead(worker.pid)
@@ -0,0 +1,274 @@
+# job_queue.py
+"""
+Kolejka zadań backupu w bazie danych (tabele backup_runs / backup_jobs).
+
+Uruchomienie to wiersz BackupRun i po jednym BackupJob na urządzenie. Zadania pobiera
+dowolna liczba procesów (panel, kontener cron, `flask backup-worker` na innych maszynach):
+- PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED - workery nie czekają na siebie nawzajem,
+- SQLite (i inne): warunkowe UPDATE ... WHERE status='pending' i sprawdzenie rowcount;
+  gdy wiersz zabrał ktoś inny, bierzemy następny kandydat.
+Worker w trakcie backupu odświeża heartbeat zadania (JobHeartbeat) - zadanie bez heartbeatu
+dłużej niż BACKUP_JOB_STALE_SECONDS (worker zabity) wraca do kolejki; po MAX_ATTEMPTS próbach
+kończy się błędem. Porzucone zadania sprawdza każdy proces co BACKUP_JOB_HEARTBEAT_SECONDS,
+a nie przy każdym pobraniu zadania (mniej zapisów blokujących SQLite).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import config
+from extensions import db
+from logger_conf import logger
+from models import BackupRun, BackupJob
+
+MAX_ATTEMPTS = 3
+
+# Ile razy próbujemy kolejnego kandydata, gdy inny worker był szybszy (SQLite)
+CLAIM_RETRIES = 10
+
+OPEN_STATUSES = ('pending', 'claimed')
+
+_requeue_lock = threading.Lock()
+_requeue_next = 0.0
+
+
+def _now() -> datetime:
+    return datetime.now()
+
+
+def _commit_update(stmt) -> int:
+    result = db.session.execute(stmt)
+    db.session.commit()
+    return result.rowcount
+
+
+def create_run(trigger_type: str, devices, failed: Optional[dict] = None) -> BackupRun:
+    """
+    Zapisuje uruchomienie i jego zadania (jedna transakcja). Zadania są pobierane w kolejności listy devices.
+    failed: urządzenia z błędem znanym przed startem (ip -> komunikat) - zadanie od razu kończy się błędem.
+    """
+    failed = failed or {}
+    run = BackupRun(trigger_type=trigger_type, total=len(devices))
+    db.session.add(run)
+    db.session.flush()
+    for d in devices:
+        if d.ip in failed:
+            db.session.add(BackupJob(run_id=run.id, device_id=d.id, device_ip=d.ip, status='error',
+                                     finished_at=_now(), error=failed[d.ip][:250]))
+        else:
+            db.session.add(BackupJob(run_id=run.id, device_id=d.id, device_ip=d.ip))
+    db.session.commit()
+    return run
+
+
+def current_run() -> Optional[BackupRun]:
+    """Najnowsze niezakończone uruchomienie (stan z bazy, nie z pamięci sesji)."""
+    return BackupRun.query.filter_by(status='running') \
+        .order_by(BackupRun.id.desc()) \
+        .populate_existing() \
+        .first()
+
+
+def run_counts(run_id: int) -> dict:
+    """Liczba zadań uruchomienia w każdym statusie."""
+    rows = db.session.query(BackupJob.status, db.func.count(BackupJob.id)) \
+        .filter(BackupJob.run_id == run_id) \
+        .group_by(BackupJob.status) \
+        .all()
+    return dict(rows)
+
+
+def has_open_jobs(run_id: int) -> bool:
+    return db.session.query(BackupJob.id) \
+        .filter(BackupJob.run_id == run_id, BackupJob.status.in_(OPEN_STATUSES)) \
+        .first() is not None
+
+
+def requeue_stale() -> None:
+    """Zadania porzucone przez martwego workera wracają do kolejki (albo kończą się błędem)."""
+    # Zadania pobrane przed dodaniem kolumny heartbeat_at - liczy się czas pobrania
+    last_seen = db.func.coalesce(BackupJob.heartbeat_at, BackupJob.claimed_at)
+    stale = db.and_(BackupJob.status == 'claimed',
+                    last_seen < _now() - timedelta(seconds=config.BACKUP_JOB_STALE_SECONDS))
+    failed = _commit_update(
+        db.update(BackupJob).where(stale, BackupJob.attempts >= MAX_ATTEMPTS)
+        .values(status='error', finished_at=_now(), error="Worker przestał odpowiadać")
+    )
+    requeued = _commit_update(
+        db.update(BackupJob).where(stale).values(status='pending', worker=None, claimed_at=None)
+    )
+    if failed or requeued:
+        logger.warning(f"Kolejka backupu: porzucone zadania - ponownie w kolejce: {requeued}, błąd: {failed}")
+
+
+def _requeue_stale_if_due() -> None:
+    """requeue_stale najwyżej raz na BACKUP_JOB_HEARTBEAT_SECONDS w procesie (wątki dzielą termin)."""
+    global _requeue_next
+    with _requeue_lock:
+        now = time.monotonic()
+        if now < _requeue_next:
+            return
+        _requeue_next = now + config.BACKUP_JOB_HEARTBEAT_SECONDS
+    requeue_stale()
+
+
+def _claimable(run_id: Optional[int]):
+    query = db.select(BackupJob.id) \
+        .join(BackupRun, BackupRun.id == BackupJob.run_id) \
+        .where(BackupJob.status == 'pending', BackupRun.status == 'running')
+    if run_id is not None:
+        query = query.where(BackupJob.run_id == run_id)
+    return query.order_by(BackupJob.id).limit(1)
+
+
+def claim_job(worker: str, run_id: Optional[int] = None) -> Optional[BackupJob]:
+    """
+    Pobiera jedno oczekujące zadanie (z danego uruchomienia albo dowolnego trwającego).
+    Zwraca zadanie ze statusem "claimed" albo None, gdy kolejka jest pusta.
+    """
+    _requeue_stale_if_due()
+    now = _now()
+    values = dict(status='claimed', worker=worker, claimed_at=now, heartbeat_at=now, attempts=BackupJob.attempts + 1)
+
+    if db.engine.dialect.name == 'postgresql':
+        job_id = db.session.execute(
+            _claimable(run_id).with_for_update(skip_locked=True, of=BackupJob)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        # Wiersz jest zablokowany do końca tej transakcji - nikt inny go nie zmieni
+        _commit_update(db.update(BackupJob).where(BackupJob.id == job_id).values(**values))
+        return db.session.get(BackupJob, job_id, populate_existing=True)
+
+    for _ in range(CLAIM_RETRIES):
+        job_id = db.session.execute(_claimable(run_id)).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        claimed = _commit_update(
+            db.update(BackupJob).where(BackupJob.id == job_id, BackupJob.status == 'pending').values(**values)
+        )
+        if claimed == 1:
+            return db.session.get(BackupJob, job_id, populate_existing=True)
+    db.session.rollback()
+    return None
+
+
+def finish_job(job_id: int, worker: str, is_success: Optional[bool], error: Optional[str] = None) -> bool:
+    """
+    Zapisuje wynik zadania (is_success None = urządzenie pominięte). False, jeśli zadanie
+    w międzyczasie wróciło do kolejki i wykonuje je inny worker (wtedy liczy się jego wynik).
+    """
+    if is_success is None:
+        status = 'skipped'
+    else:
+        status = 'success' if is_success else 'error'
+    return _commit_update(
+        db.update(BackupJob)
+        .where(BackupJob.id == job_id, BackupJob.worker == worker, BackupJob.status == 'claimed')
+        .values(status=status, finished_at=_now(),
+                error=None if is_success else (error or "Błąd backupu")[:250])
+    ) == 1
+
+
+class JobHeartbeat:
+    """
+    Heartbeat wykonywanego zadania: wątek w tle co BACKUP_JOB_HEARTBEAT_SECONDS odświeża heartbeat_at,
+    dopóki trwa backup (with JobHeartbeat(app, job_id, worker): ...). Dzięki temu długi backup
+    (wiele komend po SSH_COMMAND_TIMEOUT) nie wraca do kolejki i nie trafia do drugiego workera.
+    """
+
+    def __init__(self, app, job_id: int, worker: str):
+        self.app = app
+        self.job_id = job_id
+        self.worker = worker
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"job-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _loop(self) -> None:
+        while not self._stop.wait(config.BACKUP_JOB_HEARTBEAT_SECONDS):
+            try:
+                with self.app.app_context():
+                    if _commit_update(
+                        db.update(BackupJob)
+                        .where(BackupJob.id == self.job_id, BackupJob.worker == self.worker,
+                               BackupJob.status == 'claimed')
+                        .values(heartbeat_at=_now())
+                    ) == 0:
+                        # Zadanie wróciło do kolejki albo zostało anulowane - wynik i tak nie zostanie zapisany
+                        logger.warning(f"Zadanie #{self.job_id} nie należy już do workera {self.worker}.")
+                        return
+            except Exception as e:
+                logger.error(f"Błąd odświeżania heartbeatu zadania #{self.job_id}: {e}")
+
+
+def cancel_pending(run_id: int) -> int:
+    """Anuluje zadania, których nikt jeszcze nie pobrał. Zwraca ich liczbę."""
+    return _commit_update(
+        db.update(BackupJob)
+        .where(BackupJob.run_id == run_id, BackupJob.status == 'pending')
+        .values(status='cancelled', finished_at=_now())
+    )
+
+
+def close_abandoned_runs() -> None:
+    """
+    Zamyka uruchomienia, których właściciel zniknął (dzierżawa przejęta po braku heartbeatu).
+    Wołane przez nowego właściciela dzierżawy - w danej chwili trwa tylko jedno uruchomienie.
+    """
+    abandoned = [r.id for r in BackupRun.query.filter_by(status='running')]
+    for run_id in abandoned:
+        _commit_update(
+            db.update(BackupJob)
+            .where(BackupJob.run_id == run_id, BackupJob.status.in_(OPEN_STATUSES))
+            .values(status='cancelled', finished_at=_now())
+        )
+        _commit_update(db.update(BackupRun).where(BackupRun.id == run_id).values(status='finished', finished_at=_now()))
+        logger.warning(f"Kolejka backupu: zamknięto porzucone uruchomienie #{run_id}")
+
+
+def finalize_run(run_id: int) -> Optional[dict]:
+    """
+    Zamyka uruchomienie, jeśli nie ma już otwartych zadań, i zwraca jego podsumowanie.
+    Warunkowe UPDATE gwarantuje, że podsumowanie dostanie dokładnie jeden worker.
+    """
+    open_jobs = db.select(BackupJob.id).where(BackupJob.run_id == run_id, BackupJob.status.in_(OPEN_STATUSES))
+    closed = _commit_update(
+        db.update(BackupRun)
+        .where(BackupRun.id == run_id, BackupRun.status == 'running', ~open_jobs.exists())
+        .values(status='finished', finished_at=_now())
+    )
+    if closed != 1:
+        return None
+
+    run = db.session.get(BackupRun, run_id, populate_existing=True)
+    counts = run_counts(run_id)
+
+    def ips(status):
+        return [ip for (ip,) in db.session.query(BackupJob.device_ip)
+                .filter_by(run_id=run_id, status=status)
+                .order_by(BackupJob.id)]
+
+    return {
+        "run_id": run_id,
+        "trigger_type": run.trigger_type,
+        "total": run.total,
+        "success": counts.get('success', 0),
+        "failed": counts.get('error', 0),
+        "skipped": counts.get('skipped', 0),
+        "cancelled": counts.get('cancelled', 0),
+        "failed_ips": ips('error'),
+        "skipped_ips": ips('skipped'),
+        "duration_seconds": (run.finished_at - run.created_at).total_seconds(),
+    }
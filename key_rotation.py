@@ -0,0 +1,126 @@
+# key_rotation.py
+"""
+Przeszyfrowanie katalogu backupów bieżącym kluczem (BACKUP_ENCRYPTION_KEY).
+
+Pliki odczytywane są pierścieniem kluczy (bieżący + BACKUP_ENCRYPTION_OLD_KEYS)
+i zapisywane atomowo (plik tymczasowy + os.replace) w formacie v2.
+Pliki już zaszyfrowane bieżącym kluczem są pomijane po samym nagłówku, więc
+przerwaną rotację wystarczy uruchomić ponownie - wznowi się tam, gdzie stanęła.
+Backupy mogą działać w trakcie: nowe pliki i tak powstają z bieżącym kluczem.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+import security_utils
+import stream_crypto
+from logger_conf import logger
+
+TMP_SUFFIX = ".rotate.tmp"
+PROGRESS_INTERVAL = 5.0  # sekundy między logami postępu
+
+
+class _Throttle:
+    """Wspólny dla wszystkich wątków limit przepustowości I/O (bajty/s)."""
+
+    def __init__(self, bytes_per_second: float):
+        self.rate = bytes_per_second
+        self._next_free = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + n / self.rate
+            delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _rotate_file(path: Path, throttle: _Throttle, dry_run: bool) -> Optional[int]:
+    """Przeszyfrowuje jeden plik. Zwraca nowy rozmiar albo None, gdy plik nie wymagał zmian."""
+    try:
+        with path.open("rb") as f:
+            head = f.read(stream_crypto.HEADER_STRUCT.size)
+            if security_utils.is_current_key(head):
+                return None
+            data = head + f.read()
+    except FileNotFoundError:
+        return None  # usunięty w międzyczasie (rotacja backupów, usunięcie z panelu)
+    throttle.consume(len(data))
+
+    # Treść delt jest przepisywana bez odtwarzania - sumy kontrolne i odwołania do baz się nie zmieniają
+    plain = security_utils.decrypt_raw(data)
+    if dry_run:
+        return len(data)
+
+    tmp_path = path.with_name(path.name + TMP_SUFFIX)
+    try:
+        with tmp_path.open("wb") as f:
+            size = security_utils.write_encrypted(f, [plain])
+            f.flush()
+            os.fsync(f.fileno())
+        if not path.exists():
+            return None  # nie wskrzeszamy pliku usuniętego w trakcie
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    throttle.consume(size)
+    return size
+
+
+def rotate_backup_dir(backup_dir: Path, workers: int, max_mbps: float, dry_run: bool = False,
+                      on_rotated=None) -> dict:
+    """
+    Przeszyfrowuje wszystkie pliki w katalogu backupów pulą `workers` wątków.
+    on_rotated(nazwa_pliku, nowy_rozmiar) jest wołane w wątku wywołującym (np. do aktualizacji bazy).
+    Zwraca statystyki: total, rotated, skipped, failed.
+    """
+    # Pozostałości po przerwanym przebiegu
+    for leftover in backup_dir.glob(f"*{TMP_SUFFIX}"):
+        leftover.unlink()
+
+    # Klucze sprawdzamy raz, przed startem - zły klucz ma zatrzymać rotację, a nie każdy plik osobno
+    security_utils.get_cipher()
+
+    files = sorted(p for p in backup_dir.iterdir() if p.is_file())
+    stats = {"total": len(files), "rotated": 0, "skipped": 0, "failed": 0}
+    throttle = _Throttle(max_mbps * 1024 * 1024)
+
+    logger.info(f"Rotacja kluczy: {len(files)} plików w {backup_dir}, wątki: {workers}, "
+                f"limit: {max_mbps or 'brak'} MB/s{' (próba, bez zapisu)' if dry_run else ''}")
+
+    start = last_report = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rotate") as pool:
+        futures = {pool.submit(_rotate_file, path, throttle, dry_run): path for path in files}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                size = future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Rotacja kluczy: nie udało się przeszyfrować {path.name}: {e}")
+            else:
+                if size is None:
+                    stats["skipped"] += 1
+                else:
+                    stats["rotated"] += 1
+                    if on_rotated and not dry_run:
+                        on_rotated(path.name, size)
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                logger.info(f"Rotacja kluczy: {done}/{len(files)} ({done / (now - start):.0f} plików/s), "
+                            f"przeszyfrowano {stats['rotated']}, błędy {stats['failed']}")
+
+    logger.info(f"Rotacja kluczy zakończona w {time.monotonic() - start:.1f}s: przeszyfrowano {stats['rotated']}, "
+                f"bez zmian {stats['skipped']}, błędy {stats['failed']}.")
+    return stats
@@ -0,0 +1,75 @@
+# listings.py
+"""
+Zapytania list w panelu (i API) - jedna strona naraz, filtrowanie i sortowanie w bazie.
+Parametry przychodzą wprost z request.args.
+"""
+from datetime import datetime
+
+import config
+from extensions import db
+from models import Device, BackupLog, User
+from pagination import paginate
+
+# Wartość zastępcza dla NULL - porównania kursora w SQL nie działają na NULL
+NEVER = datetime(1970, 1, 1)
+
+# Sortowanie listy urządzeń: nazwa -> (wyrażenie SQL, ta sama wartość liczona z obiektu)
+DEVICE_SORTS = {
+    "ip": (Device.ip_sort_key, lambda d: d.ip_sort_key),
+    "sysname": (db.func.coalesce(Device.sysname, ""), lambda d: d.sysname or ""),
+    "status": (db.func.coalesce(Device.last_status, "never"), lambda d: d.last_status or "never"),
+    "last_backup": (db.func.coalesce(Device.last_backup_time, NEVER), lambda d: d.last_backup_time or NEVER),
+}
+
+DEVICE_STATUSES = ("success", "error", "running", "never")
+BACKUP_STATUSES = ("success", "error")
+
+
+def _is_desc(args, default="asc"):
+    return args.get("dir", default) == "desc"
+
+
+def device_page(args):
+    """
+    Strona listy urządzeń.
+    args: sort (ip/sysname/status/last_backup), dir (asc/desc), q (fragment IP lub sysname),
+    status, after/before (kursor).
+    """
+    sort = args.get("sort", "ip")
+    if sort not in DEVICE_SORTS:
+        sort = "ip"
+    sort_expr, sort_key = DEVICE_SORTS[sort]
+
+    query = Device.query
+    search = args.get("q", "").strip()
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(db.or_(Device.ip.like(pattern), Device.sysname.like(pattern)))
+    status = args.get("status")
+    if status in DEVICE_STATUSES:
+        query = query.filter(db.func.coalesce(Device.last_status, "never") == status)
+
+    return paginate(query, sort_expr, Device.id, sort_key, descending=_is_desc(args),
+                    after=args.get("after"), before=args.get("before"), per_page=config.PAGE_SIZE)
+
+
+def backup_history_page(device_ip, args):
+    """Historia backupów urządzenia, od najnowszych. args: status, trigger (cron/manual), after/before."""
+    query = BackupLog.query.filter_by(device_ip=device_ip)
+    status = args.get("status")
+    if status in BACKUP_STATUSES:
+        query = query.filter(BackupLog.status == status)
+    trigger = args.get("trigger")
+    if trigger in ("cron", "manual"):
+        query = query.filter(BackupLog.trigger_type == trigger)
+
+    # Indeksy (device_ip, created_at) / (device_ip, status, created_at) obsługują to sortowanie
+    return paginate(query, BackupLog.created_at, BackupLog.id, lambda log: log.created_at,
+                    descending=_is_desc(args, default="desc"),
+                    after=args.get("after"), before=args.get("before"), per_page=config.PAGE_SIZE)
+
+
+def user_page(args):
+    """Lista użytkowników po nazwie."""
+    return paginate(User.query, User.username, User.id, lambda u: u.username, descending=_is_desc(args),
+                    after=args.get("after"), before=args.get("before"), per_page=config.PAGE_SIZE)
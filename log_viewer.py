@@ -1,19 +1,124 @@
 # log_viewer.py
+import gzip
+import os
+import re
+from collections import deque
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
+
+import config
 
 # Ścieżka do głównego pliku logów aplikacji
 LOG_FILE_PATH = Path("logs") / "app.log"
 
+# Porcja czytana od końca pliku
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def ip_pattern(ip: str) -> re.Pattern:
+    """
+    Dokładne dopasowanie adresu: 10.0.0.1 nie pasuje do 10.0.0.12, 110.0.0.1 ani 10.0.0.1.5,
+    ale pasuje w "10.0.0.1:", "(10.0.0.1)", "10.0.0.1_OLT.txt" czy na końcu zdania "10.0.0.1.".
+    """
+    return re.compile(rb"(?<![A-Za-z0-9.])" + re.escape(ip.encode()) + rb"(?![A-Za-z0-9]|\.\d)")
+
+
+def log_files(log_path: Path = LOG_FILE_PATH) -> List[Path]:
+    """Bieżący log i pliki po rotacji (app.log.1.gz, app.log.2.gz, ... lub bez .gz) - od najnowszego."""
+    rotated = []
+    for path in log_path.parent.glob(f"{log_path.name}.*"):
+        suffix = path.name[len(log_path.name) + 1:].removesuffix(".gz")
+        if suffix.isdigit():
+            rotated.append((int(suffix), path))
+    files = [log_path] if log_path.is_file() else []
+    return files + [path for _, path in sorted(rotated)]
+
+
+def iter_lines_reversed(path: Path, block_size: int = READ_BLOCK_SIZE, max_bytes: int = None) -> Iterator[bytes]:
+    """
+    Linie pliku od ostatniej do pierwszej, czytane blokami od końca (bez wczytywania całości).
+    max_bytes ogranicza, jak daleko wstecz czytamy.
+    """
+    with path.open("rb") as f:
+        end = pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            if max_bytes is not None and end - pos >= max_bytes:
+                return
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + tail).split(b"\n")
+            # Pierwsza linia bloku może zaczynać się we wcześniejszym bloku
+            tail = lines[0]
+            for line in reversed(lines[1:]):
+                yield line
+        yield tail
+
+
+def _gzip_size(path: Path) -> int:
+    """Rozmiar pliku .gz po rozpakowaniu - z trailera gzip (ISIZE), bez rozpakowywania."""
+    with path.open("rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), "little")
+
+
+def _scan_size(path: Path) -> int:
+    """Ile bajtów trzeba przejrzeć, żeby przeszukać cały plik (dla .gz - po rozpakowaniu)."""
+    return _gzip_size(path) if path.suffix == ".gz" else path.stat().st_size
+
+
+def _iter_matches_reversed(path: Path, needle: bytes, pattern: re.Pattern, limit: int,
+                           max_bytes: int) -> Iterator[bytes]:
+    """Pasujące linie od najnowszej. Pliku .gz nie da się czytać od końca - czytamy go
+    w przód, pamiętając tylko ostatnie `limit` trafień. Gdy rozpakowana treść przekroczy
+    max_bytes (ISIZE w trailerze liczony modulo 4 GiB), przerywamy bez wyniku z tego pliku -
+    najstarsze linie segmentu bez najnowszych byłyby mylące."""
+    if path.suffix == ".gz":
+        last = deque(maxlen=limit)
+        scanned = 0
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                scanned += len(line)
+                if scanned > max_bytes:
+                    return
+                if needle in line and pattern.search(line):
+                    last.append(line.rstrip(b"\n"))
+        yield from reversed(last)
+        return
+
+    for line in iter_lines_reversed(path, max_bytes=max_bytes):
+        if needle in line and pattern.search(line):
+            yield line
+
 
 def get_logs_for_ip(ip: str, max_lines: int = 200) -> List[str]:
     """
-    Zwraca ostatnie max_lines linii z loga głównego,
+    Zwraca ostatnie max_lines linii z loga głównego (i plików po rotacji),
     które zawierają podany adres IP.
+    Pliki są czytane od końca, więc koszt zależy od tego, jak daleko wstecz
+    leżą pasujące linie, a nie od rozmiaru logu (z limitem LOG_VIEWER_MAX_SCAN_MB
+    przejrzanych bajtów; segmenty .gz liczone po rozpakowaniu i czytane tylko w całości).
     """
-    if not LOG_FILE_PATH.is_file():
-        return []
+    pattern = ip_pattern(ip)
+    needle = ip.encode()
+    budget = config.LOG_VIEWER_MAX_SCAN_MB * 1024 * 1024
+    found = []
+
+    for path in log_files():
+        if budget <= 0 or len(found) >= max_lines:
+            break
+        try:
+            size = _scan_size(path)
+            if path.suffix == ".gz" and size > budget:
+                break  # segmentu .gz nie przeczytamy od końca - nie zmieści się w limicie
+            for line in _iter_matches_reversed(path, needle, pattern, max_lines - len(found), budget):
+                found.append(line.rstrip(b"\r").decode("utf-8", errors="replace"))
+                if len(found) >= max_lines:
+                    break
+            budget -= size
+        except (OSError, EOFError):
+            continue  # plik zniknął (lub jest jeszcze kompresowany) w trakcie rotacji
 
-    lines = LOG_FILE_PATH.read_text(encoding="utf-8").splitlines()
-    filtered = [line for line in lines if ip in line]
-    return filtered[-max_lines:]
+    found.reverse()
+    return found
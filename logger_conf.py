@@ -1,10 +1,24 @@
 # logger_conf.py
 
+import atexit
+import gzip
 import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from contextlib import contextmanager
 from pathlib import Path
 
 import colorlog
 
+import config
+
+try:
+    import fcntl  # blokada między procesami (Linux / kontener); na Windows jej nie ma
+except ImportError:
+    fcntl = None
+
 # ===== USTAWIENIA FORMATÓW =====
 
 # Format logów na konsoli (z kolorami)
@@ -14,6 +28,72 @@ CONSOLE_LOG_FORMAT = "%(log_color)s%(levelname)-8s%(reset)s %(message)s"
 FILE_LOG_FORMAT = "%(asctime)s %(levelname)-8s %(name)s - %(message)s"
 
 
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler bezpieczny przy wielu procesach piszących do jednego pliku
+    (workery gunicorna + kontener cron na wspólnym wolumenie logs/).
+
+    - zapis pod blokadą współdzieloną (flock na app.log.lock), rotacja pod wyłączną,
+    - przed zapisem sprawdzamy i-węzeł: jeśli inny proces zrobił rotację, otwieramy plik na nowo,
+    - stare segmenty są kompresowane: app.log.1.gz, app.log.2.gz, ...
+    """
+
+    def __init__(self, filename, max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress_segment
+        self._lock_path = f"{self.baseFilename}.lock"
+
+    @contextmanager
+    def _file_lock(self, mode):
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self) -> None:
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self.stream.fileno()).st_ino:
+            self.stream.close()
+            self.stream = self._open()
+
+    @staticmethod
+    def _compress_segment(source: str, dest: str) -> None:
+        # Najpierw rename (atomowo, pod blokadą nikt już nie dopisze do starego pliku), potem kompresja
+        plain = dest[:-len(".gz")]
+        os.replace(source, plain)
+        with open(plain, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(plain)
+
+    def emit(self, record):
+        try:
+            with self._file_lock(fcntl.LOCK_SH if fcntl else None):
+                self._reopen_if_rotated()
+                if not self.shouldRollover(record):
+                    logging.FileHandler.emit(self, record)
+                    return
+
+            with self._file_lock(fcntl.LOCK_EX if fcntl else None):
+                self._reopen_if_rotated()
+                # Inny proces mógł zrobić rotację, zanim dostaliśmy blokadę
+                if self.shouldRollover(record):
+                    self.doRollover()
+                logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+
 # ===== KONFIGURACJA LOGGERA GŁÓWNEGO =====
 
 # Używamy głównego loggera (root), żeby wszystkie moduły korzystały z jednej konfiguracji
@@ -35,18 +115,42 @@ if not logger.handlers:
     console_handler.setFormatter(console_formatter)
 
     # ===== HANDLER DO PLIKU =====
-    # Logi zapisujemy do katalogu "logs/app.log"
+    # Logi zapisujemy do katalogu "logs/app.log", z rotacją po LOG_MAX_BYTES
     log_dir = Path("logs")
     log_dir.mkdir(parents=True, exist_ok=True)
 
     file_path = log_dir / "app.log"
-    file_handler = logging.FileHandler(file_path, encoding="utf-8")
+    file_handler = SharedRotatingFileHandler(file_path, config.LOG_MAX_BYTES, config.LOG_BACKUP_COUNT)
     # Do pliku zapisujemy pełne DEBUG (wszystko)
     file_handler.setLevel(logging.DEBUG)
 
     file_formatter = logging.Formatter(FILE_LOG_FORMAT)
     file_handler.setFormatter(file_formatter)
 
-    # ===== DODANIE HANDLERÓW =====
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # ===== KOLEJKA =====
+    # Wątki backupu tylko wrzucają rekord do kolejki; zapis na dysk/konsolę robi
+    # osobny wątek QueueListener, więc I/O (i rotacja) nigdy nie blokuje producentów.
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_listener = None
+
+    def _start_listener():
+        """Własna kolejka i wątek zapisu w każdym procesie - wątki nie przechodzą przez fork()."""
+        global queue_listener
+        queue_handler.queue = queue.SimpleQueue()
+        queue_listener = logging.handlers.QueueListener(queue_handler.queue, console_handler, file_handler,
+                                                        respect_handler_level=True)
+        queue_listener.start()
+
+    def _stop_listener():
+        # Przy wyjściu (np. krótki proces cron_worker) dopisujemy resztę kolejki
+        if queue_listener is not None:
+            queue_listener.stop()
+
+    _start_listener()
+    atexit.register(_stop_listener)
+    # Proces potomny (np. worker gunicorna po fork() z mastera, który już zaimportował ten moduł)
+    # dziedziczy handler, ale nie wątek - uruchamiamy w nim nowy
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_start_listener)
+
+    logger.addHandler(queue_handler)
@@ -0,0 +1,157 @@
+# metrics.py
+"""
+Metryki Prometheus (endpoint /metrics - routes/metrics_bp.py).
+
+Liczniki i histogramy zapisuje każdy proces: workery gunicorna, demon crona, `flask backup-worker`.
+Z PROMETHEUS_MULTIPROC_DIR (wspólny wolumen) każdy proces pisze do własnych plików w tym katalogu,
+a /metrics sumuje je wszystkie - wynik nie zależy od tego, który worker gunicorna odpowiedział.
+Nazwy plików i sprzątanie po zakończonych procesach - metrics_files.py.
+
+Stan bieżącego uruchomienia (postęp, liczba zadań w toku, otwarte circuit breakery) nie jest
+licznikiem procesu - /metrics czyta go z bazy w chwili odczytu (RunCollector).
+"""
+import os
+import time
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess, values)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config
+import job_queue
+import metrics_files
+from extensions import db
+from logger_conf import logger
+from models import BackupRun, Device
+
+MULTIPROCESS = bool(config.PROMETHEUS_MULTIPROC_DIR)
+
+if MULTIPROCESS:
+    os.makedirs(config.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = config.PROMETHEUS_MULTIPROC_DIR
+    values.ValueClass = values.MultiProcessValue(process_identifier=metrics_files.process_identifier)
+
+DURATION_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+BACKUPS = Counter("olt_backup_jobs", "Zakończone backupy urządzeń", ["status", "trigger"])
+DEVICE_DURATION = Histogram("olt_backup_device_duration_seconds", "Czas backupu jednego urządzenia",
+                            ["status"], buckets=DURATION_BUCKETS)
+PHASE_DURATION = Histogram("olt_backup_phase_duration_seconds", "Czas fazy backupu (BackupLog.timings)",
+                           ["phase"], buckets=PHASE_BUCKETS)
+BYTES_FETCHED = Counter("olt_backup_fetched_bytes", "Bajty odebrane z urządzeń w sesjach SSH")
+BYTES_STORED = Counter("olt_backup_stored_bytes", "Bajty zapisane na dysk (nowe pliki backupu)")
+SSH_RETRIES = Counter("olt_backup_ssh_retries", "Ponowione próby połączenia SSH")
+CIRCUIT_TRIPS = Counter("olt_backup_circuit_breaker_trips", "Otwarcia circuit breakera urządzenia")
+IN_PROGRESS = Gauge("olt_backup_devices_in_progress", "Urządzenia backupowane w tej chwili (wszystkie procesy)",
+                    multiprocess_mode="livesum")
+DECRYPT_DURATION = Histogram("olt_backup_decrypt_duration_seconds", "Odszyfrowanie pełnego backupu",
+                             buckets=FAST_BUCKETS)
+ZIP_EXPORT_DURATION = Histogram("olt_backup_zip_export_duration_seconds", "Eksport ZIP najnowszych backupów",
+                                buckets=DURATION_BUCKETS)
+ZIP_EXPORT_FILES = Counter("olt_backup_zip_export_files", "Pliki spakowane w eksportach ZIP")
+REQUEST_DURATION = Histogram("olt_backup_http_request_duration_seconds", "Czas obsługi zapytania HTTP",
+                             ["blueprint", "method", "status"], buckets=FAST_BUCKETS)
+DB_QUERIES = Counter("olt_backup_db_queries", "Zapytania SQL (źródło: blueprint albo 'background')",
+                     ["source"])
+
+
+def observe_device(status: str, seconds: float, ssh_dev, stored_bytes: int = 0) -> None:
+    """Pomiar backupu urządzenia - wywoływany po zakończeniu _process_single_device."""
+    DEVICE_DURATION.labels(status=status).observe(seconds)
+    BYTES_FETCHED.inc(ssh_dev.bytes_received)
+    BYTES_STORED.inc(stored_bytes)
+    if ssh_dev.attempts > 1:
+        SSH_RETRIES.inc(ssh_dev.attempts - 1)
+    for phase, phase_seconds in ssh_dev.timings.items():
+        PHASE_DURATION.labels(phase=phase).observe(phase_seconds)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    source = (request.blueprint or "app") if has_request_context() else "background"
+    DB_QUERIES.labels(source=source).inc()
+
+
+def init_app(app) -> None:
+    """Czas obsługi zapytań HTTP per blueprint."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            REQUEST_DURATION.labels(
+                blueprint=request.blueprint or ("static" if request.endpoint == "static" else "app"),
+                method=request.method,
+                status=str(response.status_code),
+            ).observe(time.perf_counter() - started)
+        return response
+
+
+class RunCollector:
+    """Stan uruchomień z bazy w chwili odczytu - wspólny dla panelu, crona i workerów."""
+
+    def collect(self):
+        active = GaugeMetricFamily("olt_backup_run_active", "Czy trwa uruchomienie backupu (1/0)")
+        jobs = GaugeMetricFamily("olt_backup_run_jobs", "Zadania bieżącego uruchomienia wg statusu",
+                                 labels=["status"])
+        elapsed = GaugeMetricFamily("olt_backup_run_elapsed_seconds", "Czas trwania bieżącego uruchomienia")
+        last_finished = GaugeMetricFamily("olt_backup_last_run_finished_timestamp_seconds",
+                                          "Koniec ostatniego zakończonego uruchomienia (unix)")
+        last_duration = GaugeMetricFamily("olt_backup_last_run_duration_seconds",
+                                          "Czas ostatniego zakończonego uruchomienia")
+        circuit_open = GaugeMetricFamily("olt_backup_devices_circuit_open",
+                                         "Urządzenia pomijane przez otwarty circuit breaker")
+
+        run = job_queue.current_run()
+        active.add_metric([], 1 if run else 0)
+        if run:
+            for status, count in job_queue.run_counts(run.id).items():
+                jobs.add_metric([status], count)
+            elapsed.add_metric([], (datetime.now() - run.created_at).total_seconds())
+
+        finished = BackupRun.query.filter(BackupRun.status == 'finished', BackupRun.finished_at.isnot(None)) \
+            .order_by(BackupRun.finished_at.desc()) \
+            .first()
+        if finished:
+            last_finished.add_metric([], finished.finished_at.timestamp())
+            last_duration.add_metric([], (finished.finished_at - finished.created_at).total_seconds())
+
+        circuit_open.add_metric([], db.session.query(db.func.count(Device.id))
+                                .filter(Device.circuit_open_until > datetime.now()).scalar())
+
+        yield from (active, jobs, elapsed, last_finished, last_duration, circuit_open)
+
+
+class _ProcessMetrics:
+    """Metryki bieżącego procesu (tryb bez PROMETHEUS_MULTIPROC_DIR)."""
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def render():
+    """(treść, content-type) odpowiedzi /metrics - wywoływane w kontekście aplikacji."""
+    registry = CollectorRegistry()
+    if MULTIPROCESS:
+        multiprocess.MultiProcessCollector(registry, path=config.PROMETHEUS_MULTIPROC_DIR)
+    else:
+        registry.register(_ProcessMetrics())
+    registry.register(RunCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def remove_dead_process_files() -> None:
+    """Sprzątanie plików metryk przy starcie procesu (cron_worker, backup-worker) - patrz metrics_files."""
+    removed = metrics_files.remove_dead_process_files()
+    if removed:
+        logger.debug(f"Metryki: usunięto {removed} plików zakończonych procesów")
@@ -0,0 +1,64 @@
+# metrics_files.py
+"""
+Pliki metryk w PROMETHEUS_MULTIPROC_DIR: nazwy procesów i sprzątanie po zakończonych procesach.
+
+Moduł celowo nie importuje metrics ani logger_conf - używa go master gunicorna (gunicorn.conf.py),
+który nie może uruchamiać wątku logowania przed rozwidleniem workerów.
+"""
+import glob
+import os
+import socket
+
+from prometheus_client import multiprocess
+
+import config
+
+MULTIPROC_DIR = config.PROMETHEUS_MULTIPROC_DIR
+
+# Znak "_" rozdziela części nazwy pliku metryk - nie może wystąpić w identyfikatorze procesu
+_HOST = socket.gethostname().replace("_", "-")
+
+
+def process_identifier(pid=None) -> str:
+    """host-pid: procesy w różnych kontenerach mogą mieć ten sam pid."""
+    return f"{_HOST}-{pid or os.getpid()}"
+
+
+def mark_process_dead(pid: int) -> None:
+    """Usuwa wskazania "na żywo" (urządzenia w toku) zakończonego procesu - hook child_exit gunicorna."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(process_identifier(pid), MULTIPROC_DIR)
+
+
+def remove_dead_process_files() -> int:
+    """
+    Przy starcie procesu: usuwa pliki metryk zakończonych procesów z tego hosta (kontenera),
+    żeby katalog nie rósł z każdym restartem. Pliki innych kontenerów i działających procesów zostają.
+    Zwraca liczbę usuniętych plików.
+    """
+    if not MULTIPROC_DIR:
+        return 0
+    removed = 0
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, f"*_{_HOST}-*.db")):
+        try:
+            pid = int(os.path.basename(path)[:-3].rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            continue
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
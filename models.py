@@ -1,10 +1,22 @@
 # models.py
+import ipaddress
+import json
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from extensions import db
 
 
+def ip_sort_key(ip: str) -> str:
+    """Klucz sortowania adresów jako tekst: 10.0.0.2 przed 10.0.0.12 (IPv4 przed IPv6, niepoprawne na końcu)."""
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return f"9:{ip}"
+    return f"{addr.version}:{int(addr):0{32 if addr.version == 6 else 8}x}"
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -25,6 +37,8 @@ class Device(db.Model):
     __tablename__ = 'devices'
     id = db.Column(db.Integer, primary_key=True)
     ip = db.Column(db.String(45), unique=True, nullable=False)
+    # Liczbowy porządek adresów dla sortowania po stronie bazy (ustawiany razem z ip)
+    ip_sort_key = db.Column(db.String(40), index=True)
     sysname = db.Column(db.String(100), nullable=True)
     enabled = db.Column(db.Boolean, default=True)
 
@@ -33,15 +47,68 @@ class Device(db.Model):
     last_status = db.Column(db.String(20), default="never")  # success, error, running
     last_error = db.Column(db.Text, nullable=True)
 
+    # Czas ostatniej zmiany wiersza - API statusu zwraca tylko urządzenia zmienione od podanego momentu
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+
+    # Wskaźnik na najnowszy udany backup (utrzymywany przy zapisie/usuwaniu backupów),
+    # żeby lista "ostatnich backupów" nie musiała przeglądać całej historii
+    latest_success_log_id = db.Column(db.Integer, nullable=True)
+    latest_success_log = db.relationship(
+        'BackupLog',
+        primaryjoin='Device.latest_success_log_id == BackupLog.id',
+        foreign_keys=[latest_success_log_id],
+        viewonly=True,
+    )
+
+    # Stan "zdrowia" połączenia (device_health.py): adaptacyjny timeout i circuit breaker
+    consecutive_failures = db.Column(db.Integer, default=0)
+    last_rtt_ms = db.Column(db.Float, nullable=True)  # czas nawiązania połączenia TCP
+    avg_connect_seconds = db.Column(db.Float, nullable=True)  # średnia krocząca (EWMA) pełnego logowania
+    circuit_open_until = db.Column(db.DateTime, nullable=True)  # do tego czasu urządzenie jest pomijane
+    avg_backup_seconds = db.Column(db.Float, nullable=True)  # EWMA czasu udanego backupu (kolejność w uruchomieniu)
+
+    @validates('ip')
+    def _set_ip_sort_key(self, key, value):
+        self.ip_sort_key = ip_sort_key(value)
+        return value
+
+    @classmethod
+    def rebuild_ip_sort_keys(cls):
+        """Uzupełnia ip_sort_key urządzeń dodanych przed wprowadzeniem kolumny."""
+        for dev in cls.query.filter(cls.ip_sort_key.is_(None)).all():
+            dev.ip_sort_key = ip_sort_key(dev.ip)
+        db.session.commit()
+
+    def refresh_latest_success(self):
+        """Ustawia wskaźnik na podstawie historii (po usunięciu wpisów, dodaniu urządzenia ze starą historią)."""
+        self.latest_success_log_id = BackupLog.latest_success_id_query(self.ip).scalar()
+
+    @classmethod
+    def rebuild_latest_success(cls):
+        """Przelicza wskaźniki wszystkich urządzeń jednym UPDATE (np. po aktualizacji schematu)."""
+        subquery = BackupLog.latest_success_id_query(cls.ip).scalar_subquery()
+        db.session.execute(db.update(cls).values(latest_success_log_id=subquery))
+        db.session.commit()
+
 
 class BackupLog(db.Model):
     __tablename__ = 'backup_logs'
+    __table_args__ = (
+        # Historia urządzenia, ostatni udany backup, rotacja, wyszukiwanie bazy delty
+        db.Index('ix_backup_logs_device_status_created', 'device_ip', 'status', 'created_at'),
+        # Historia urządzenia na stronie szczegółów (wszystkie statusy)
+        db.Index('ix_backup_logs_device_created', 'device_ip', 'created_at'),
+        # Sprawdzanie, czy plik jest jeszcze używany (przed usunięciem z dysku)
+        db.Index('ix_backup_logs_filename', 'filename'),
+        db.Index('ix_backup_logs_base_filename', 'base_filename'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     device_ip = db.Column(db.String(45), nullable=False)  # IP jako klucz obcy logiczny
     filename = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     status = db.Column(db.String(20))  # success, error
-    size_bytes = db.Column(db.Integer, default=0)
+    size_bytes = db.Column(db.Integer, default=0)  # rozmiar pliku na dysku
+    logical_size_bytes = db.Column(db.Integer, nullable=True)  # rozmiar konfiguracji po odszyfrowaniu
 
     # Czy plik jest zaszyfrowany?
     encrypted = db.Column(db.Boolean, default=True)
@@ -49,6 +116,131 @@ class BackupLog(db.Model):
     # NOWE POLE: Kto uruchomił backup? 'cron' lub 'manual'
     trigger_type = db.Column(db.String(20), default='manual')
 
+    # SHA-256 znormalizowanej konfiguracji (bez linii zmiennych, np. znaczników czasu)
+    content_hash = db.Column(db.String(64), nullable=True)
+
+    # Konfiguracja bez zmian - wpis wskazuje na plik poprzedniego backupu zamiast nowej kopii
+    unchanged = db.Column(db.Boolean, default=False)
+
+    # Tryb delta: plik snapshotu, względem którego zapisano deltę (None = pełna kopia)
+    base_filename = db.Column(db.String(200), nullable=True)
+
+    # Pomiar backupu: uruchomienie (BackupRun), czas całkowity, bajty odebrane w sesji SSH
+    # oraz czasy faz i bajty wyniku każdej komendy jako JSON (patrz timing_details)
+    run_id = db.Column(db.Integer, nullable=True, index=True)
+    duration_seconds = db.Column(db.Float, nullable=True)
+    bytes_received = db.Column(db.Integer, nullable=True)
+    timings = db.Column(db.Text, nullable=True)
+
+    def timing_details(self) -> dict:
+        """{'phases': {faza: sekundy}, 'bytes': {cmd_<n>: bajty}, 'attempts': n} albo {} dla starszych wpisów."""
+        if not self.timings:
+            return {}
+        try:
+            return json.loads(self.timings)
+        except ValueError:
+            return {}
+
+    @classmethod
+    def latest_success_id_query(cls, device_ip):
+        """Id najnowszego udanego backupu urządzenia (device_ip może być kolumną - podzapytanie skorelowane)."""
+        return db.session.query(cls.id) \
+            .filter(cls.device_ip == device_ip, cls.status == 'success') \
+            .order_by(cls.created_at.desc(), cls.id.desc()) \
+            .limit(1)
+
+    @classmethod
+    def latest_per_device(cls):
+        """
+        Najnowszy udany backup każdego urządzenia: istniejące urządzenia przez wskaźnik w Device
+        (bez skanowania historii), usunięte z listy - najnowszy wpis ich IP (historia zostaje po usunięciu).
+        """
+        pointed = db.session.query(Device.latest_success_log_id) \
+            .filter(Device.latest_success_log_id.isnot(None))
+        removed = db.session.query(db.func.max(cls.id)) \
+            .filter(cls.status == 'success', cls.device_ip.notin_(db.session.query(Device.ip))) \
+            .group_by(cls.device_ip)
+        return cls.query.filter(db.or_(cls.id.in_(pointed), cls.id.in_(removed))) \
+            .order_by(cls.created_at.desc()) \
+            .all()
+
+    @classmethod
+    def file_in_use(cls, filename, exclude_ids=()):
+        """Czy jakiś (inny niż wykluczone) wpis wciąż wskazuje na ten plik - wprost lub jako na bazę delty?"""
+        query = cls.query.filter(db.or_(cls.filename == filename, cls.base_filename == filename))
+        if exclude_ids:
+            query = query.filter(cls.id.notin_(list(exclude_ids)))
+        return db.session.query(query.exists()).scalar()
+
+    @classmethod
+    def unreferenced_files(cls, logs):
+        """
+        Pliki, które można usunąć z dysku razem z podanymi wpisami:
+        ich własne pliki i snapshoty bazowe, na które nie wskazuje już żaden inny wpis.
+        """
+        deleted_ids = {log.id for log in logs}
+        candidates = set()
+        for log in logs:
+            candidates.add(log.filename)
+            if log.base_filename:
+                candidates.add(log.base_filename)
+        return {name for name in candidates if not cls.file_in_use(name, exclude_ids=deleted_ids)}
+
+
+class RunLease(db.Model):
+    """
+    Dzierżawa uruchomienia backupu wspólna dla wszystkich procesów (workery gunicorna, kontener cron).
+    Właściciel odświeża heartbeat_at; dzierżawę bez heartbeatu dłużej niż RUN_LEASE_STALE_SECONDS
+    może przejąć inny proces. Flaga anulowania jest widoczna dla wszystkich.
+    Postęp uruchomienia liczymy z jego zadań (BackupRun / BackupJob).
+    """
+    __tablename__ = 'run_leases'
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=True)  # None = wolna
+    trigger_type = db.Column(db.String(20), nullable=True)
+    acquired_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False)
+
+
+class BackupRun(db.Model):
+    """
+    Jedno uruchomienie backupu (ręczne lub z crona) rozbite na zadania per urządzenie.
+    Status "finished" ustawia ten, kto zakończył ostatnie zadanie - on też wysyła podsumowanie.
+    """
+    __tablename__ = 'backup_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    trigger_type = db.Column(db.String(20), default='manual')
+    status = db.Column(db.String(20), default='running', index=True)  # running, finished
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    total = db.Column(db.Integer, default=0)
+
+
+class BackupJob(db.Model):
+    """
+    Zadanie backupu jednego urządzenia w ramach uruchomienia.
+    Dowolny proces (panel, cron, `flask backup-worker`) może je pobrać - patrz job_queue.py.
+    """
+    __tablename__ = 'backup_jobs'
+    __table_args__ = (
+        db.Index('ix_backup_jobs_run_status', 'run_id', 'status'),
+        db.Index('ix_backup_jobs_status_heartbeat', 'status', 'heartbeat_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('backup_runs.id'), nullable=False)
+    device_id = db.Column(db.Integer, nullable=False)
+    device_ip = db.Column(db.String(45), nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, claimed, success, error, skipped, cancelled
+    worker = db.Column(db.String(100), nullable=True)  # kto wykonuje/wykonał zadanie
+    attempts = db.Column(db.Integer, default=0)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # odświeżane przez workera w trakcie backupu
+    finished_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    run = db.relationship('BackupRun', lazy='joined')
+
 
 class Settings(db.Model):
     """Tabela na klucz-wartość dla ustawień (np. harmonogram)"""
@@ -8,11 +8,13 @@ from logger_conf import logger
 
 class NotificationService:
     @staticmethod
-    def send_backup_summary(total, success, failed, failed_ips, duration_seconds):
+    def send_backup_summary(total, success, failed, failed_ips, duration_seconds, skipped_ips=None):
         """
         Wysyła podsumowanie backupu na Mattermost.
         Wersja kompaktowa (max 3 linie tekstu dla sukcesu).
+        skipped_ips - urządzenia pominięte przez circuit breaker (wiele porażek z rzędu).
         """
+        skipped_ips = skipped_ips or []
         webhook_url = config.MATTERMOST_WEBHOOK_URL
 
         if not webhook_url:
@@ -20,7 +22,7 @@ class NotificationService:
             return
 
         # Kolory paska bocznego
-        if failed == 0:
+        if failed == 0 and not skipped_ips:
             color = "#00c951"  # Green
             status_text = "SUKCES"
         elif success == 0:
@@ -41,6 +43,8 @@ class NotificationService:
         # Linia 3: Statystyki - ZMIANA: Usunięcie ewentualnych znaków '#' i formatowanie jako zwykły tekst
         # Zostawiamy tylko **gwiazdki** przy liczbach, żeby były pogrubione, ale czcionka będzie mała.
         line_3 = f"Razem: **{total}** ✅ OK: **{success}** ❌ Błąd: **{failed}**"
+        if skipped_ips:
+            line_3 += f" ⏭️ Pominięte: **{len(skipped_ips)}**"
 
         text_lines = [line_1, line_2, line_3]
 
@@ -52,6 +56,12 @@ class NotificationService:
             text_lines.append("---")
             text_lines.append(f"**Błędy IP:** {', '.join(failed_ips)}")
 
+        if skipped_ips:
+            if not failed_ips:
+                text_lines.append("")
+                text_lines.append("---")
+            text_lines.append(f"**Pominięte IP (circuit breaker):** {', '.join(skipped_ips)}")
+
         payload = {
             "username": "OLT Backup Bot",
             "icon_url": "https://cdn-icons-png.flaticon.com/512/2950/2950063.png",
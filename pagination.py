@@ -0,0 +1,114 @@
+# pagination.py
+"""
+Stronicowanie "keyset" (kursorem): kolejna strona to rekordy za ostatnim
+wierszem poprzedniej (WHERE (klucz, id) > (..)), a nie OFFSET - koszt strony
+nie rośnie z jej numerem, a wstawienia w trakcie przeglądania nie przesuwają wyników.
+
+Kursor to zakodowana (base64) para [wartość klucza sortowania, id] ostatniego/pierwszego wiersza.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+from flask import request, url_for
+
+from extensions import db
+
+
+@dataclass
+class Page:
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None  # kursor dla ?after= (None = ostatnia strona)
+    prev_cursor: Optional[str] = None  # kursor dla ?before= (None = pierwsza strona)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    raw = json.dumps([_encode_value(sort_value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]):
+    """(wartość, id) albo None dla pustego lub uszkodzonego kursora (wtedy pokazujemy pierwszą stronę)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return _decode_value(sort_value), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def _after(sort_expr, id_col, descending: bool, position):
+    value, row_id = position
+    if descending:
+        return db.or_(sort_expr < value, db.and_(sort_expr == value, id_col < row_id))
+    return db.or_(sort_expr > value, db.and_(sort_expr == value, id_col > row_id))
+
+
+def paginate(query, sort_expr, id_col, sort_key: Callable[[Any], Any], descending: bool = False,
+             after: Optional[str] = None, before: Optional[str] = None, per_page: int = 100) -> Page:
+    """
+    Jedna strona wyników `query` posortowanych po (sort_expr, id_col).
+    sort_key(obiekt) musi dawać tę samą wartość, co sort_expr w bazie (np. z tym samym COALESCE).
+    """
+    after_pos = decode_cursor(after)
+    before_pos = None if after_pos else decode_cursor(before)
+
+    if before_pos:
+        # Strona wstecz: czytamy w odwrotnej kolejności i odwracamy wynik
+        query = query.filter(_after(sort_expr, id_col, not descending, before_pos))
+        order = (sort_expr.asc(), id_col.asc()) if descending else (sort_expr.desc(), id_col.desc())
+    else:
+        if after_pos:
+            query = query.filter(_after(sort_expr, id_col, descending, after_pos))
+        order = (sort_expr.desc(), id_col.desc()) if descending else (sort_expr.asc(), id_col.asc())
+
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+
+    def cursor(item):
+        return encode_cursor(sort_key(item), item.id)
+
+    if before_pos:
+        items.reverse()
+        return Page(items=items,
+                    next_cursor=cursor(items[-1]) if items else None,
+                    prev_cursor=cursor(items[0]) if items and has_more else None)
+
+    return Page(items=items,
+                next_cursor=cursor(items[-1]) if items and has_more else None,
+                prev_cursor=cursor(items[0]) if items and after_pos else None)
+
+
+def page_url(**changes) -> str:
+    """
+    Adres bieżącej listy ze zmienionymi parametrami (szablony: linki stron i sortowania).
+    Kursor zawsze jest zerowany - zmiana sortowania/filtra zaczyna od pierwszej strony.
+    Parametr z wartością None jest usuwany.
+    """
+    args = request.args.to_dict()
+    args.pop("after", None)
+    args.pop("before", None)
+    for key, value in changes.items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
@@ -0,0 +1,100 @@
+# performance_report.py
+"""
+Raport "gdzie ucieka czas" z ostatnich uruchomień backupu:
+- najwolniejsze urządzenia - czas zadania (BackupJob: od pobrania do zakończenia, także nieudane),
+  razem z fazą, która u danego urządzenia trwa najdłużej,
+- fazy - zsumowane czasy z pomiarów zapisanych w BackupLog.timings (tylko udane backupy).
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import config
+from extensions import db
+from models import BackupRun, BackupJob, BackupLog
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def _phase_totals(run_ids) -> Dict[str, Dict[str, List[float]]]:
+    """device_ip -> faza -> lista czasów z kolejnych backupów."""
+    per_device: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    logs = BackupLog.query.filter(BackupLog.run_id.in_(run_ids), BackupLog.timings.isnot(None)).all()
+    for log in logs:
+        for phase, seconds in log.timing_details().get('phases', {}).items():
+            per_device[log.device_ip][phase].append(seconds)
+    return per_device
+
+
+def _slowest_devices(run_ids, per_device_phases, limit: int) -> List[dict]:
+    jobs = db.session.query(BackupJob.device_id, BackupJob.device_ip, BackupJob.status,
+                            BackupJob.claimed_at, BackupJob.finished_at) \
+        .filter(BackupJob.run_id.in_(run_ids), BackupJob.status.in_(('success', 'error')),
+                BackupJob.claimed_at.isnot(None), BackupJob.finished_at.isnot(None)) \
+        .all()
+
+    durations: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    device_ids: Dict[str, int] = {}
+    for device_id, ip, status, claimed_at, finished_at in jobs:
+        durations[ip].append((finished_at - claimed_at).total_seconds())
+        device_ids[ip] = device_id
+        if status == 'error':
+            errors[ip] += 1
+
+    rows = []
+    for ip, values in durations.items():
+        phases = per_device_phases.get(ip, {})
+        slowest_phase = max(phases.items(), key=lambda item: sum(item[1]) / len(item[1]), default=None)
+        rows.append({
+            'device_id': device_ids[ip],
+            'ip': ip,
+            'runs': len(values),
+            'errors': errors[ip],
+            'avg_seconds': sum(values) / len(values),
+            'max_seconds': max(values),
+            'slowest_phase': slowest_phase[0] if slowest_phase else None,
+            'slowest_phase_seconds': sum(slowest_phase[1]) / len(slowest_phase[1]) if slowest_phase else None,
+        })
+    rows.sort(key=lambda row: row['avg_seconds'], reverse=True)
+    return rows[:limit]
+
+
+def _phases(per_device_phases) -> List[dict]:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    for phases in per_device_phases.values():
+        for phase, values in phases.items():
+            samples[phase].extend(values)
+
+    grand_total = sum(sum(values) for values in samples.values()) or 1.0
+    rows = [{
+        'phase': phase,
+        'count': len(values),
+        'total_seconds': sum(values),
+        'avg_seconds': sum(values) / len(values),
+        'p95_seconds': _percentile(values, 0.95),
+        'max_seconds': max(values),
+        'share': sum(values) / grand_total,
+    } for phase, values in samples.items()]
+    rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+    return rows
+
+
+def build_report(runs: Optional[int] = None, limit: Optional[int] = None) -> dict:
+    """Najwolniejsze urządzenia i fazy z `runs` ostatnich uruchomień (domyślnie PERFORMANCE_REPORT_RUNS)."""
+    runs = max(1, runs) if runs else config.PERFORMANCE_REPORT_RUNS
+    limit = limit or config.PERFORMANCE_REPORT_LIMIT
+
+    recent = BackupRun.query.order_by(BackupRun.id.desc()).limit(runs).all()
+    run_ids = [run.id for run in recent]
+    if not run_ids:
+        return {'runs': [], 'devices': [], 'phases': []}
+
+    per_device_phases = _phase_totals(run_ids)
+    return {
+        'runs': recent,
+        'devices': _slowest_devices(run_ids, per_device_phases, limit),
+        'phases': _phases(per_device_phases),
+    }
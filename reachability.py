@@ -0,0 +1,92 @@
+# reachability.py
+"""
+Sprawdzenie przed backupem, czy urządzenia odpowiadają na porcie SSH (pre-flight).
+
+Wszystkie połączenia TCP są otwierane naraz na gniazdach nieblokujących, a jeden wątek
+czeka na nie przez selectors - 500 urządzeń to najwyżej PREFLIGHT_TIMEOUT sekund
+(razy liczba paczek po PREFLIGHT_MAX_SOCKETS), a nie 500 osobnych oczekiwań w wątkach SSH.
+Samo połączenie TCP wystarcza - nie wysyłamy żadnych danych.
+"""
+import errno
+import ipaddress
+import os
+import selectors
+import socket
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import config
+from logger_conf import logger
+
+
+@dataclass
+class ProbeResult:
+    reachable: bool
+    rtt_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+def _open(ip: str, port: int):
+    """Nieblokujące gniazdo z rozpoczętym połączeniem albo ProbeResult z błędem."""
+    try:
+        family = socket.AF_INET6 if ipaddress.ip_address(ip).version == 6 else socket.AF_INET
+    except ValueError:
+        return ProbeResult(False, error="Niepoprawny adres IP")
+
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    code = sock.connect_ex((ip, port))
+    if code in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+        return sock
+    sock.close()
+    return ProbeResult(False, error=os.strerror(code))
+
+
+def _sweep_batch(ips, port: int, timeout: float, results: Dict[str, ProbeResult]) -> None:
+    started = time.monotonic()
+    with selectors.DefaultSelector() as selector:
+        for ip in ips:
+            opened = _open(ip, port)
+            if isinstance(opened, ProbeResult):
+                results[ip] = opened
+            else:
+                selector.register(opened, selectors.EVENT_WRITE, ip)
+
+        deadline = started + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                sock, ip = key.fileobj, key.data
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    results[ip] = ProbeResult(True, rtt_ms=(time.monotonic() - started) * 1000)
+                else:
+                    results[ip] = ProbeResult(False, error=os.strerror(code))
+                selector.unregister(sock)
+                sock.close()
+
+        for key in list(selector.get_map().values()):
+            results[key.data] = ProbeResult(False, error=f"brak odpowiedzi w {timeout:g} s")
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+
+
+def sweep(ips: Iterable[str], port: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, ProbeResult]:
+    """Wynik próby połączenia TCP z każdym adresem (ip -> ProbeResult)."""
+    port = config.SSH_PORT if port is None else port
+    timeout = config.PREFLIGHT_TIMEOUT if timeout is None else timeout
+    ips = list(dict.fromkeys(ips))
+    results: Dict[str, ProbeResult] = {}
+    started = time.monotonic()
+
+    batch = config.PREFLIGHT_MAX_SOCKETS
+    for offset in range(0, len(ips), batch):
+        _sweep_batch(ips[offset:offset + batch], port, timeout, results)
+
+    down = sum(1 for r in results.values() if not r.reachable)
+    logger.info(f"Pre-flight TCP/{port}: {len(ips) - down}/{len(ips)} urządzeń odpowiada "
+                f"({time.monotonic() - started:.1f} s)")
+    return results
@@ -0,0 +1,154 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_login import login_required
+
+import config
+from extensions import db
+from models import Device
+from services import backup_service
+from listings import device_page, backup_history_page
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+# Zapas czasu przy "since": zmiana zapisana tuż przed zapytaniem, ale zatwierdzona po nim,
+# ma starszy updated_at - lepiej wysłać wiersz dwa razy niż wcale
+SINCE_OVERLAP = timedelta(seconds=5)
+
+# Co ile sekund bez zmian wysłać pusty komentarz (utrzymanie połączenia przez proxy)
+HEARTBEAT_SECONDS = 15
+
+
+def _parse_since(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _device_status(d):
+    return {
+        "id": d.id,
+        "ip": d.ip,
+        "sysname": d.sysname,
+        "last_status": d.last_status,
+        "last_error": d.last_error,
+        "last_backup_time": d.last_backup_time.strftime("%Y-%m-%d %H:%M") if d.last_backup_time else None,
+    }
+
+
+def _status_snapshot(since):
+    """
+    Urządzenia zmienione od `since` (wszystkie, jeśli None) + znacznik, od którego pytać następnym razem.
+    Transakcja jest od razu zamykana - długie połączenie nie może trzymać blokady odczytu SQLite.
+    """
+    cursor = (datetime.now() - SINCE_OVERLAP).isoformat(timespec="seconds")
+    query = Device.query
+    if since is not None:
+        query = query.filter(Device.updated_at > since)
+    devices = [_device_status(d) for d in query.all()]
+    any_running = db.session.query(Device.id).filter_by(last_status='running').first() is not None
+    progress = backup_service.progress()
+    db.session.rollback()
+
+    return {
+        "since": cursor,
+        "busy": progress is not None or any_running,
+        "progress": progress,
+        "devices": devices,
+    }
+
+
+def _backup_status(log):
+    return {
+        "id": log.id,
+        "created_at": log.created_at.isoformat(timespec="seconds") if log.created_at else None,
+        "filename": log.filename,
+        "status": log.status,
+        "trigger_type": log.trigger_type,
+        "unchanged": bool(log.unchanged),
+        "size_bytes": log.size_bytes,
+        "logical_size_bytes": log.logical_size_bytes,
+        "run_id": log.run_id,
+        "duration_seconds": log.duration_seconds,
+        "bytes_received": log.bytes_received,
+        "timings": log.timing_details(),
+    }
+
+
+def _page_json(page, serialize):
+    return jsonify({
+        "items": [serialize(item) for item in page.items],
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    })
+
+
+@api_bp.route("/devices")
+@login_required
+def devices():
+    """Strona listy urządzeń: ?sort=ip|sysname|status|last_backup&dir=&q=&status=&after=|before=<kursor>"""
+    return _page_json(device_page(request.args), _device_status)
+
+
+@api_bp.route("/devices/<int:dev_id>/backups")
+@login_required
+def device_backups(dev_id):
+    """Strona historii backupów urządzenia: ?status=&trigger=&after=|before=<kursor>"""
+    dev = Device.query.get_or_404(dev_id)
+    return _page_json(backup_history_page(dev.ip, request.args), _backup_status)
+
+
+@api_bp.route("/status")
+@login_required
+def status():
+    """Stan urządzeń zmienionych od ?since=<ISO> (pole "since" z poprzedniej odpowiedzi)."""
+    return jsonify(_status_snapshot(_parse_since(request.args.get("since"))))
+
+
+@api_bp.route("/status/stream")
+@login_required
+def status_stream():
+    """
+    Server-Sent Events: zdarzenie po każdej zmianie statusu.
+    Zmiany z tego procesu budzą strumień od razu (BackupService.notify_change),
+    zmiany z innych procesów (workery gunicorna, kontener cron) - przy odpytaniu bazy co STATUS_POLL_SECONDS.
+    Połączenie kończy się po STATUS_STREAM_MAX_SECONDS; EventSource wznawia je z nagłówkiem
+    Last-Event-ID, więc nie giną zmiany z przerwy.
+    """
+    since = _parse_since(request.headers.get("Last-Event-ID") or request.args.get("since"))
+
+    def generate():
+        deadline = time.monotonic() + config.STATUS_STREAM_MAX_SECONDS
+        last_sent = time.monotonic()
+        last_busy = None
+        sent = {}  # id -> ostatnio wysłany stan (zapas SINCE_OVERLAP zwraca wiersze ponownie)
+        seq = backup_service.change_seq
+        cursor = since
+
+        yield f"retry: {int(config.STATUS_POLL_SECONDS * 1000)}\n\n"
+        while time.monotonic() < deadline:
+            snapshot = _status_snapshot(cursor)
+            cursor = _parse_since(snapshot["since"])
+            snapshot["devices"] = [d for d in snapshot["devices"] if sent.get(d["id"]) != d]
+            sent.update((d["id"], d) for d in snapshot["devices"])
+
+            state = (snapshot["busy"], snapshot["progress"])
+            if snapshot["devices"] or state != last_busy:
+                last_busy = state
+                last_sent = time.monotonic()
+                yield f"id: {snapshot['since']}\ndata: {json.dumps(snapshot)}\n\n"
+            elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+                last_sent = time.monotonic()
+                yield ": ping\n\n"
+
+            seq = backup_service.wait_for_change(seq, config.STATUS_POLL_SECONDS)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    # Bez buforowania po drodze (nginx), inaczej zdarzenia dochodzą paczkami
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
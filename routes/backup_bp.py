@@ -1,14 +1,25 @@
+import codecs
 import io
+import itertools
 import threading
+import time
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from flask import Blueprint, request, flash, redirect, url_for, render_template, send_file, current_app
+from flask import (Blueprint, request, flash, redirect, url_for, render_template, current_app,
+                   Response, abort, jsonify, stream_template, stream_with_context)
 from flask_login import login_required
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 
 from extensions import db
-from models import BackupLog
+from logger_conf import logger
+from models import BackupLog, Device
 from services import backup_service
 import config
+import content_cache
+import metrics
+import performance_report
 import security_utils
 
 backup_bp = Blueprint('backup', __name__)
@@ -58,13 +69,41 @@ def backup_cancel():
     return redirect(url_for("main.index")) # POPRAWKA
 
 
+def _decode_stream(chunks):
+    """bajty UTF-8 -> tekst, porcjami (znaki rozcięte między porcjami są sklejane)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _slice_stream(chunks, start, stop):
+    """Wycina z strumienia bajty [start, stop) - dla żądań Range."""
+    pos = 0
+    for chunk in chunks:
+        end = pos + len(chunk)
+        if end > start and pos < stop:
+            yield chunk[max(0, start - pos):stop - pos]
+        pos = end
+        if pos >= stop:
+            break
+
+
 @backup_bp.route("/backup/view/<int:log_id>")
 @login_required
 def view_backup(log_id):
     log = BackupLog.query.get_or_404(log_id)
     path = Path(config.BACKUP_DIR) / log.filename
-    content = security_utils.decrypt_from_file(path)
-    return render_template("view_backup.html", filename=log.filename, content=content)
+    if path.exists():
+        # Treść trafia do przeglądarki ramka po ramce, bez składania całości w pamięci
+        content = _decode_stream(content_cache.iter_backup(path))
+    else:
+        content = [security_utils.decrypt_from_file(path)]
+    return stream_template("view_backup.html", filename=log.filename, content=content)
 
 
 @backup_bp.route("/backup/download/<int:log_id>")
@@ -72,30 +111,63 @@ def view_backup(log_id):
 def download_backup(log_id):
     log = BackupLog.query.get_or_404(log_id)
     path = Path(config.BACKUP_DIR) / log.filename
-    content = security_utils.decrypt_from_file(path)
-    mem = io.BytesIO()
-    mem.write(content.encode('utf-8'))
-    mem.seek(0)
+    if not path.exists():
+        abort(404)
 
     dl_name = log.filename if log.filename.endswith('.txt') else f"{log.filename}.txt"
+    chunks = content_cache.iter_backup(path)
 
-    return send_file(
-        mem,
-        as_attachment=True,
-        download_name=dl_name,
-        mimetype="text/plain"
-    )
+    # Pierwsza porcja przed wysłaniem nagłówków: sprawdza nagłówek pliku, klucz i pierwszą ramkę
+    # (delta - całe odtworzenie z bazą). Błąd to odpowiedź 500, a nie urwana treść pod obiecanym Content-Length.
+    try:
+        first = next(chunks, b"")
+    except Exception as e:
+        logger.error(f"Błąd odczytu backupu {log.filename}: {e}")
+        first = f"{security_utils.READ_ERROR_PREFIX} {e}]".encode("utf-8")
+    if first.startswith(security_utils.READ_ERROR_PREFIX.encode("utf-8")):
+        return Response(first, status=500, mimetype="text/plain")
+    chunks = itertools.chain([first], chunks)
+    status = 200
+    headers = {}
+
+    # Znany rozmiar po odszyfrowaniu pozwala podać Content-Length i obsłużyć Range
+    length = log.logical_size_bytes
+    if length is not None:
+        headers["Accept-Ranges"] = "bytes"
+        byte_range = request.range.range_for_length(length) if request.range else None
+        if request.range and byte_range is None:
+            raise RequestedRangeNotSatisfiable(length=length)
+        if byte_range:
+            start, stop = byte_range
+            chunks = _slice_stream(chunks, start, stop)
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+            headers["Content-Length"] = str(stop - start)
+        else:
+            headers["Content-Length"] = str(length)
+
+    response = Response(stream_with_context(chunks), status=status, mimetype="text/plain",
+                        headers=headers)
+    response.headers.set("Content-Disposition", "attachment", filename=dl_name)
+    return response
 
 
 @backup_bp.route("/backup/delete/<int:log_id>", methods=["POST"])
 @login_required
 def delete_backup(log_id):
     log = BackupLog.query.get_or_404(log_id)
-    path = Path(config.BACKUP_DIR) / log.filename
     try:
-        if path.exists():
-            path.unlink()
+        # Plik może być współdzielony z wpisami "bez zmian" lub być bazą delt innych backupów
+        for filename in BackupLog.unreferenced_files([log]):
+            path = Path(config.BACKUP_DIR) / filename
+            if path.exists():
+                path.unlink()
+            content_cache.web_cache.invalidate(filename)
         db.session.delete(log)
+        device = Device.query.filter_by(ip=log.device_ip).first()
+        if device and device.latest_success_log_id == log.id:
+            db.session.flush()
+            device.refresh_latest_success()
         db.session.commit()
         flash(f"Usunięto backup {log.filename}")
     except Exception as e:
@@ -104,47 +176,116 @@ def delete_backup(log_id):
     return redirect(request.referrer or url_for('main.index'))
 
 
+@backup_bp.route("/backup/cache/stats")
+@login_required
+def cache_stats():
+    return jsonify(content_cache.web_cache.stats())
+
+
 @backup_bp.route("/backups/latest")
 @login_required
 def show_latest_backups():
-    logs = BackupLog.query.filter_by(status='success').order_by(BackupLog.created_at.desc()).limit(500).all()
-    unique_backups = []
-    seen_ips = set()
-    for log in logs:
-        if log.device_ip not in seen_ips:
-            unique_backups.append(log)
-            seen_ips.add(log.device_ip)
-    return render_template("latest_backups.html", backups=unique_backups)
+    return render_template("latest_backups.html", backups=BackupLog.latest_per_device())
+
+
+@backup_bp.route("/backups/performance")
+@login_required
+def performance():
+    runs = max(1, request.args.get("runs", config.PERFORMANCE_REPORT_RUNS, type=int))
+    return render_template("performance.html", runs=runs, report=performance_report.build_report(runs=runs))
 
 
 @backup_bp.route("/backups/latest/download-all")
 @login_required
 def download_latest_backups_all():
-    logs = BackupLog.query.filter_by(status='success').order_by(BackupLog.created_at.desc()).limit(500).all()
-    if not logs:
+    unique_logs = BackupLog.latest_per_device()
+    if not unique_logs:
         flash("Brak backupów do pobrania.")
         return redirect(url_for("backup.show_latest_backups")) # POPRAWKA
 
-    seen_ips = set()
-    unique_logs = []
-    for log in logs:
-        if log.device_ip not in seen_ips:
-            unique_logs.append(log)
-            seen_ips.add(log.device_ip)
-
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
-        for log in unique_logs:
-            path = Path(config.BACKUP_DIR) / log.filename
-            if path.exists():
-                content = security_utils.decrypt_from_file(path)
-                arcname = log.filename if log.filename.endswith('.txt') else f"{log.filename}.txt"
-                zf.writestr(arcname, content)
-
-    mem.seek(0)
-    return send_file(
-        mem,
-        mimetype="application/zip",
-        as_attachment=True,
-        download_name="latest_backups.zip",
-    )
\ No newline at end of file
+    try:
+        compression, level = _zip_compression(request.args.get("level", config.ZIP_EXPORT_LEVEL))
+    except ValueError:
+        flash("Nieprawidłowy poziom kompresji ZIP.")
+        return redirect(url_for("backup.show_latest_backups"))
+
+    entries = []
+    for log in unique_logs:
+        path = Path(config.BACKUP_DIR) / log.filename
+        if path.exists():
+            arcname = log.filename if log.filename.endswith('.txt') else f"{log.filename}.txt"
+            entries.append((arcname, path))
+
+    response = Response(
+        stream_with_context(_iter_zip(entries, compression, level)),
+        mimetype="application/zip"
+    )
+    response.headers.set("Content-Disposition", "attachment", filename="latest_backups.zip")
+    return response
+
+
+def _zip_compression(value):
+    """'store' -> bez kompresji (najszybciej), '0'-'9' -> deflate z danym poziomem."""
+    value = str(value).strip().lower()
+    if value == "store":
+        return zipfile.ZIP_STORED, None
+    level = int(value)
+    if not 0 <= level <= 9:
+        raise ValueError(value)
+    return zipfile.ZIP_DEFLATED, level
+
+
+class _ZipStream(io.RawIOBase):
+    """Nieprzewijalny 'plik', do którego pisze ZipFile - zebrane bajty odbiera generator odpowiedzi."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _iter_zip(entries, compression, level):
+    """
+    Generator archiwum ZIP: kolejne pliki trafiają do klienta od razu po spakowaniu,
+    a odszyfrowanie następnych wpisów trwa równolegle w ograniczonej puli wątków
+    (co najwyżej 2x ZIP_EXPORT_WORKERS wpisów w pamięci naraz).
+    """
+    stream = _ZipStream()
+    workers = max(1, config.ZIP_EXPORT_WORKERS)
+    pending = iter(entries)
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip") as pool:
+        window = deque()
+
+        def prefetch():
+            entry = next(pending, None)
+            if entry:
+                arcname, path = entry
+                window.append((arcname, pool.submit(security_utils.decrypt_from_file, path)))
+
+        for _ in range(workers * 2):
+            prefetch()
+
+        with zipfile.ZipFile(stream, "w", compression=compression, compresslevel=level) as zf:
+            while window:
+                arcname, future = window.popleft()
+                prefetch()
+                zf.writestr(arcname, future.result())
+                yield stream.drain()
+
+        yield stream.drain()
+
+    metrics.ZIP_EXPORT_DURATION.observe(time.perf_counter() - started)
+    metrics.ZIP_EXPORT_FILES.inc(len(entries))
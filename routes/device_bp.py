@@ -1,8 +1,10 @@
 from flask import Blueprint, request, flash, redirect, url_for, render_template
 from flask_login import login_required
 from extensions import db
-from models import Device, BackupLog
+from models import Device
 from log_viewer import get_logs_for_ip
+from listings import backup_history_page
+import device_health
 
 device_bp = Blueprint('device', __name__)
 
@@ -20,6 +22,8 @@ def add_device():
 
     try:
         new_dev = Device(ip=ip, enabled=True)
+        # Urządzenie mogło już kiedyś być w bazie - historia backupów została
+        new_dev.refresh_latest_success()
         db.session.add(new_dev)
         db.session.commit()
         flash(f"Dodano urządzenie: {ip}", "success")
@@ -50,14 +54,16 @@ def delete_device(dev_id):
 @login_required
 def device_details(dev_id):
     dev = Device.query.get_or_404(dev_id)
-    db_logs = BackupLog.query.filter_by(device_ip=dev.ip).order_by(BackupLog.created_at.desc()).limit(50).all()
+    history = backup_history_page(dev.ip, request.args)
     text_logs = get_logs_for_ip(dev.ip, max_lines=100)
 
     return render_template(
         "device_details.html",
         device=dev,
-        db_logs=db_logs,
-        text_logs=text_logs
+        db_logs=history.items,
+        history=history,
+        text_logs=text_logs,
+        circuit_open=device_health.is_circuit_open(dev)
     )
 
 # Aliasy
@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for
+from datetime import datetime
+
+from flask import Blueprint, render_template, redirect, url_for, request
 from flask_login import login_required
 from models import Device
+from listings import device_page
 from services import backup_service
 from schedule import ScheduleService
+from routes.api_bp import SINCE_OVERLAP
 
 main_bp = Blueprint('main', __name__)
 
@@ -10,17 +14,23 @@ main_bp = Blueprint('main', __name__)
 @main_bp.route("/")
 @login_required
 def index():
-    devices = Device.query.all()
-    thread_active = backup_service.is_running()
-    any_device_running = any(d.last_status == 'running' for d in devices)
+    page = device_page(request.args)
+    progress = backup_service.progress()
+    thread_active = progress is not None
+    any_device_running = Device.query.filter_by(last_status='running').first() is not None
     should_refresh = thread_active or any_device_running
 
     schedule = ScheduleService.load_schedule()
+    # Od tego momentu strona pobiera już tylko zmiany (/api/status/stream)
+    status_since = (datetime.now() - SINCE_OVERLAP).isoformat(timespec="seconds")
 
     return render_template(
         "index.html",
-        devices=devices,
+        devices=page.items,
+        page=page,
+        progress=progress,
         has_running=should_refresh,
         is_service_busy=thread_active,
-        schedule=schedule
+        schedule=schedule,
+        status_since=status_since
     )
\ No newline at end of file
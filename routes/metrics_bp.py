@@ -0,0 +1,19 @@
+import hmac
+
+from flask import Blueprint, Response, abort, request
+
+import config
+import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route("/metrics")
+def prometheus_metrics():
+    # Prometheus nie loguje się do panelu - opcjonalna ochrona tokenem zamiast sesji
+    if config.METRICS_TOKEN:
+        expected = f"Bearer {config.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            abort(401)
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -3,6 +3,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from models import User
 from extensions import db
+from listings import user_page
 
 user_admin_bp = Blueprint('user_admin', __name__)
 
@@ -19,8 +20,8 @@ def admin_required(f):
 @login_required
 @admin_required
 def list_users():
-    users = User.query.all()
-    return render_template('users.html', users=users)
+    page = user_page(request.args)
+    return render_template('users.html', users=page.items, page=page)
 
 @user_admin_bp.route('/users/add', methods=['POST'])
 @login_required
@@ -0,0 +1,120 @@
+# run_lease.py
+"""
+Dzierżawa uruchomienia backupu w bazie danych (tabela run_leases).
+
+Zastępuje blokadę w pamięci procesu: panel ma kilka workerów gunicorna,
+a cron działa w osobnym kontenerze - każdy z nich musi widzieć, że backup trwa,
+móc go anulować i nie może uruchomić drugiego równolegle.
+
+Przejęcie dzierżawy to jedno warunkowe UPDATE (wolna albo bez heartbeatu),
+więc jest atomowe zarówno w SQLite, jak i w PostgreSQL.
+"""
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+import config
+from extensions import db
+from logger_conf import logger
+from models import RunLease
+
+LEASE_NAME = "backup"
+
+
+def _now() -> datetime:
+    return datetime.now()
+
+
+def _stale_before() -> datetime:
+    return _now() - timedelta(seconds=config.RUN_LEASE_STALE_SECONDS)
+
+
+def _ensure_row(name: str) -> None:
+    if db.session.get(RunLease, name) is None:
+        try:
+            db.session.add(RunLease(name=name))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # inny proces utworzył wiersz w tym samym momencie
+
+
+def _update(name: str, *conditions, **values) -> int:
+    result = db.session.execute(
+        db.update(RunLease).where(RunLease.name == name, *conditions).values(**values)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def active_lease(name: str = LEASE_NAME) -> Optional[RunLease]:
+    """Bieżąca (żywa) dzierżawa albo None."""
+    # populate_existing - stan z bazy, nie z pamięci sesji (zmienia go inny proces)
+    lease = db.session.get(RunLease, name, populate_existing=True)
+    if lease is None or lease.owner is None or lease.heartbeat_at is None:
+        return None
+    if lease.heartbeat_at < _stale_before():
+        return None
+    return lease
+
+
+def request_cancel(name: str = LEASE_NAME) -> bool:
+    """Ustawia flagę anulowania dla trwającego uruchomienia (w dowolnym procesie)."""
+    return _update(name, RunLease.owner.isnot(None), cancel_requested=True) > 0
+
+
+class Lease:
+    """
+    Dzierżawa trzymana przez ten proces. Wątek w tle odświeża heartbeat i przy okazji
+    odczytuje flagę anulowania (cancelled) - wątki backupu sprawdzają ją bez zapytań do bazy.
+    """
+
+    def __init__(self, app, name: str = LEASE_NAME):
+        self.app = app
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.cancelled = False
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self, trigger_type: str) -> bool:
+        _ensure_row(self.name)
+        now = _now()
+        acquired = _update(
+            self.name,
+            db.or_(RunLease.owner.is_(None), RunLease.heartbeat_at < _stale_before()),
+            owner=self.owner, trigger_type=trigger_type, acquired_at=now, heartbeat_at=now,
+            cancel_requested=False,
+        ) == 1
+        if acquired:
+            self._thread = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+            self._thread.start()
+        return acquired
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        _update(self.name, RunLease.owner == self.owner, owner=None, heartbeat_at=None, cancel_requested=False)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(config.RUN_LEASE_HEARTBEAT_SECONDS):
+            try:
+                with self.app.app_context():
+                    if _update(self.name, RunLease.owner == self.owner, heartbeat_at=_now()) == 0:
+                        # Ktoś przejął dzierżawę (np. uznał nas za martwych) - kończymy jak przy anulowaniu
+                        logger.error("Utracono dzierżawę uruchomienia backupu - przerywam.")
+                        self.lost = True
+                        self.cancelled = True
+                        return
+                    lease = db.session.get(RunLease, self.name, populate_existing=True)
+                    if lease.cancel_requested and not self.cancelled:
+                        logger.info("Otrzymano żądanie anulowania backupu.")
+                        self.cancelled = True
+            except Exception as e:
+                logger.error(f"Błąd odświeżania dzierżawy backupu: {e}")
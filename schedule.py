@@ -1,6 +1,7 @@
 # schedule.py
+import uuid
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 
 from extensions import db
@@ -24,6 +25,9 @@ class ScheduleService:
     Serwis do zarządzania harmonogramem w bazie danych (tabela Settings).
     """
 
+    # Zmienia się przy każdym zapisie harmonogramu - demon crona czyta cały harmonogram tylko wtedy
+    VERSION_KEY = 'schedule_version'
+
     @staticmethod
     def _get_setting(key: str, default: str) -> str:
         """Pobiera surową wartość z tabeli Settings lub zwraca default."""
@@ -81,11 +85,17 @@ class ScheduleService:
             cls._set_setting('schedule_minute', str(schedule.minute))
             if schedule.last_run_date:
                 cls._set_setting('schedule_last_run', schedule.last_run_date)
+            cls._set_setting(cls.VERSION_KEY, uuid.uuid4().hex)
 
             logger.info("Zapisano harmonogram do bazy danych.")
         except Exception as e:
             logger.error(f"Błąd zapisu harmonogramu do DB: {e}")
 
+    @classmethod
+    def get_version(cls) -> str:
+        """Wersja harmonogramu (jedno zapytanie po kluczu)."""
+        return cls._get_setting(cls.VERSION_KEY, '')
+
     @classmethod
     def update_last_run_date(cls, date_str: str) -> None:
         """Aktualizuje tylko datę ostatniego uruchomienia."""
@@ -118,4 +128,21 @@ def should_run_now(schedule: BackupSchedule, now: datetime) -> bool:
     if now >= scheduled_today:
         return True
 
-    return False
\ No newline at end of file
+    return False
+
+
+def next_run_time(schedule: BackupSchedule, now: datetime) -> Optional[datetime]:
+    """
+    Najbliższy moment, w którym should_run_now zwróci True (now, jeśli już),
+    albo None, gdy harmonogram jest wyłączony.
+    """
+    if not schedule.enabled:
+        return None
+    if should_run_now(schedule, now):
+        return now
+
+    scheduled = now.replace(hour=schedule.hour, minute=schedule.minute, second=0, microsecond=0)
+    if scheduled <= now or schedule.last_run_date == now.date().isoformat():
+        # Dzisiejszy backup już był
+        scheduled += timedelta(days=1)
+    return scheduled
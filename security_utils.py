@@ -1,14 +1,64 @@
 # security_utils.py
+import base64
+import io
+import lzma
 import os
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from cryptography.fernet import Fernet
+from typing import BinaryIO, Iterable, Iterator
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 import config
+import delta_storage
+import metrics
+import stream_crypto
+from stream_crypto import FILE_MAGIC, COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZMA
 from logger_conf import logger
 
+# === FORMATY PLIKU ===
+# v2 (zapisywany): ramki AES-GCM, patrz stream_crypto - odczyt strumieniowy w stałej pamięci.
+# v1: b"OLTB" | wersja (1 bajt) | algorytm kompresji (1 bajt) | token Fernet w postaci binarnej.
+# Pliki bez nagłówka to starsze formaty: sam token Fernet (base64) albo czysty tekst.
+FORMAT_V1 = 1
+
+COMPRESSION_IDS = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "lzma": COMPRESSION_LZMA}
+
+# Porcja tekstu kodowana naraz przy zapisie
+ENCODE_CHUNK_SIZE = 256 * 1024
+
+# Treść zwracana zamiast konfiguracji, gdy pliku nie da się odczytać
+READ_ERROR_PREFIX = "[BŁĄD ODCZYTU PLIKU:"
+
+
+def decompress(data: bytes, algorithm: int) -> bytes:
+    if algorithm == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if algorithm == COMPRESSION_LZMA:
+        return lzma.decompress(data)
+    if algorithm == COMPRESSION_NONE:
+        return data
+    raise ValueError(f"Nieznany algorytm kompresji: {algorithm}")
+
+
+def _configured_compression() -> int:
+    try:
+        return COMPRESSION_IDS[config.BACKUP_COMPRESSION]
+    except KeyError:
+        raise ValueError(f"Nieznana wartość BACKUP_COMPRESSION: {config.BACKUP_COMPRESSION}")
+
+
+# Cache odszyfrowanych snapshotów bazowych (dla odtwarzania delt):
+# klucz (ścieżka, mtime_ns, rozmiar) -> tekst, najdawniej używane wypadają pierwsze.
+_base_cache = OrderedDict()
+_base_cache_lock = threading.Lock()
+
 
 def get_cipher():
     """
-    Zwraca obiekt Fernet.
+    Zwraca pierścień kluczy (MultiFernet): szyfruje bieżącym kluczem,
+    odszyfrowuje bieżącym lub dowolnym z BACKUP_ENCRYPTION_OLD_KEYS.
     Rzuca wyjątek, jeśli klucz jest pusty, None lub nieprawidłowy.
     """
     key = config.BACKUP_ENCRYPTION_KEY
@@ -17,27 +67,78 @@ def get_cipher():
     if not key or not key.strip():
         raise ValueError("Brak klucza BACKUP_ENCRYPTION_KEY w pliku .env!")
 
-    # 2. Próba utworzenia obiektu Fernet (walidacja formatu klucza)
+    # 2. Próba utworzenia obiektów Fernet (walidacja formatu kluczy)
     try:
-        return Fernet(key.encode() if isinstance(key, str) else key)
+        current = _build_cipher(key.strip().encode())
     except Exception as e:
         raise ValueError(f"Nieprawidłowy format klucza BACKUP_ENCRYPTION_KEY: {e}")
 
+    old = []
+    for old_key in config.BACKUP_ENCRYPTION_OLD_KEYS:
+        try:
+            old.append(_build_cipher(old_key.encode()))
+        except Exception as e:
+            raise ValueError(f"Nieprawidłowy format klucza w BACKUP_ENCRYPTION_OLD_KEYS: {e}")
+
+    return MultiFernet([current] + old)
+
+
+@lru_cache(maxsize=16)
+def _build_cipher(key: bytes) -> Fernet:
+    # Parsowanie klucza raz na proces (na klucz), a nie przy każdym odczycie pliku
+    return Fernet(key)
+
+
+def get_stream_key() -> bytes:
+    """Klucz AES dla formatu v2 (zapis), wyprowadzony z BACKUP_ENCRYPTION_KEY (walidowanego przez get_cipher)."""
+    get_cipher()
+    return stream_crypto.derive_key(base64.urlsafe_b64decode(config.BACKUP_ENCRYPTION_KEY.strip()))
+
+
+def get_stream_keys() -> dict:
+    """Wszystkie klucze v2 z pierścienia: id klucza (z nagłówka pliku) -> klucz AES."""
+    get_cipher()
+    keys = {}
+    for fernet_key in [config.BACKUP_ENCRYPTION_KEY] + config.BACKUP_ENCRYPTION_OLD_KEYS:
+        key = stream_crypto.derive_key(base64.urlsafe_b64decode(fernet_key.strip()))
+        keys.setdefault(stream_crypto.key_id(key), key)
+    return keys
+
+
+def stream_key_for(head: bytes) -> bytes:
+    """Klucz pasujący do pliku v2 - wybierany po id z nagłówka, bez prób odszyfrowania."""
+    try:
+        return get_stream_keys()[stream_crypto.read_header_key_id(head)]
+    except KeyError:
+        raise stream_crypto.StreamFormatError(
+            "Plik zaszyfrowano kluczem spoza BACKUP_ENCRYPTION_KEY / BACKUP_ENCRYPTION_OLD_KEYS")
+
+
+def is_current_key(head: bytes) -> bool:
+    """Czy plik jest już w formacie v2 i zaszyfrowany bieżącym kluczem (nie wymaga rotacji)."""
+    if not stream_crypto.is_stream_file(head):
+        return False
+    try:
+        return stream_crypto.read_header_key_id(head) == stream_crypto.key_id(get_stream_key())
+    except stream_crypto.StreamFormatError:
+        return False
+
 
 def encrypt_to_file(content: str, filepath: Path) -> bool:
     """
-    Zapisuje treść (str) do pliku TYLKO w formie zaszyfrowanej.
+    Zapisuje treść (str) do pliku TYLKO w formie zaszyfrowanej (format v2: skompresowane ramki).
     Jeśli szyfrowanie się nie uda (brak klucza/zły klucz) -> zwraca False i nic nie zapisuje.
     """
     try:
-        # Pobranie szyfratora (rzuci błędem jeśli klucz jest zły/pusty)
-        cipher = get_cipher()
+        # Pobranie klucza (rzuci błędem jeśli klucz jest zły/pusty)
+        get_stream_key()
+        _configured_compression()
 
-        data_bytes = content.encode('utf-8')
-        encrypted_data = cipher.encrypt(data_bytes)
+        chunks = (content[i:i + ENCODE_CHUNK_SIZE].encode('utf-8')
+                  for i in range(0, len(content), ENCODE_CHUNK_SIZE))
 
         with filepath.open("wb") as f:
-            f.write(encrypted_data)
+            write_encrypted(f, chunks)
 
         return True
 
@@ -54,7 +155,122 @@ def encrypt_to_file(content: str, filepath: Path) -> bool:
         return False
 
 
+def write_encrypted(out: BinaryIO, chunks: Iterable[bytes]) -> int:
+    """Szyfruje porcje bajtów bieżącym kluczem i skonfigurowaną kompresją (format v2). Zwraca liczbę bajtów."""
+    return stream_crypto.encrypt_stream(out, chunks, get_stream_key(), _configured_compression(),
+                                        config.BACKUP_COMPRESSION_LEVEL, config.BACKUP_FRAME_SIZE)
+
+
+def decrypt_raw(data: bytes) -> bytes:
+    """
+    Odszyfrowana zawartość pliku dokładnie tak, jak ją zapisano (delty nie są odtwarzane).
+    W przeciwieństwie do decrypt_from_file nie ma tu odczytu "na próbę" jako tekst -
+    ValueError, gdy żaden klucz z pierścienia nie pasuje albo plik nie jest zaszyfrowany.
+    """
+    if stream_crypto.is_stream_file(data):
+        return b"".join(stream_crypto.decrypt_stream(io.BytesIO(data), stream_key_for(data)))
+    if data.startswith(FILE_MAGIC):
+        return _decode_container(data)
+    try:
+        return get_cipher().decrypt(data)
+    except InvalidToken:
+        raise ValueError("Plik nie jest zaszyfrowany żadnym kluczem z pierścienia (lub to stary plik tekstowy)")
+
+
+@metrics.DECRYPT_DURATION.time()
 def decrypt_from_file(filepath: Path) -> str:
+    """
+    Odczytuje backup jako pełny tekst konfiguracji.
+    Pliki delty (tryb BACKUP_STORAGE_MODE=delta) są odtwarzane z pliku bazowego
+    w tym samym katalogu - dla wywołującego różnica jest niewidoczna.
+    """
+    text = _read_plaintext(filepath)
+    if not delta_storage.is_delta(text):
+        return text
+
+    try:
+        base_path = filepath.parent / delta_storage.delta_base_filename(text)
+        return delta_storage.apply_delta(_read_base_snapshot(base_path), text)
+    except (OSError, delta_storage.DeltaError) as e:
+        logger.error(f"Błąd odtwarzania delty {filepath}: {e}")
+        return f"{READ_ERROR_PREFIX} {e}]"
+
+
+def iter_decrypted(filepath: Path) -> Iterator[bytes]:
+    """
+    Generator odszyfrowanej treści backupu (UTF-8) porcjami.
+    Pliki v2 są czytane ramka po ramce w stałej pamięci; starsze formaty
+    i delty (wymagające odtworzenia) są zwracane jedną porcją.
+    Błąd w trakcie odczytu pliku v2 przerywa generator wyjątkiem StreamFormatError.
+    """
+    delta_magic = delta_storage.DELTA_MAGIC.encode("utf-8")
+
+    with filepath.open("rb") as f:
+        head = f.read(stream_crypto.HEADER_STRUCT.size)
+        if stream_crypto.is_stream_file(head):
+            f.seek(0)
+            stream = stream_crypto.decrypt_stream(f, stream_key_for(head))
+
+            # Początek treści rozstrzyga, czy to delta
+            first = b""
+            for chunk in stream:
+                first += chunk
+                if len(first) >= len(delta_magic):
+                    break
+
+            # Delta musi zostać odtworzona w całości - wracamy do ścieżki pełnej
+            if not first.startswith(delta_magic):
+                if first:
+                    yield first
+                yield from stream
+                return
+
+    yield decrypt_from_file(filepath).encode("utf-8")
+
+
+def _read_base_snapshot(base_path: Path) -> str:
+    """Odszyfrowany snapshot bazowy, z cache (unieważnianego zmianą mtime/rozmiaru pliku)."""
+    st = base_path.stat()
+    key = (str(base_path), st.st_mtime_ns, st.st_size)
+
+    with _base_cache_lock:
+        if key in _base_cache:
+            _base_cache.move_to_end(key)
+            return _base_cache[key]
+
+    text = _read_plaintext(base_path)
+    # Błąd odczytu (np. chwilowy) nie trafia do cache - inaczej psułby delty do zmiany pliku bazowego
+    if text.startswith(READ_ERROR_PREFIX):
+        raise delta_storage.DeltaError(f"Nie udało się odczytać pliku bazowego {base_path.name}")
+    if delta_storage.is_delta(text):
+        raise delta_storage.DeltaError(f"Plik bazowy {base_path.name} sam jest deltą")
+
+    with _base_cache_lock:
+        _base_cache[key] = text
+        while len(_base_cache) > config.DELTA_BASE_CACHE_SIZE:
+            _base_cache.popitem(last=False)
+    return text
+
+
+def _decode_container(data: bytes) -> bytes:
+    """Odszyfrowuje i rozpakowuje plik w formacie z nagłówkiem FILE_MAGIC."""
+    header_len = len(FILE_MAGIC) + 2
+    if len(data) < header_len:
+        raise ValueError("Uszkodzony nagłówek pliku backupu")
+
+    version, algorithm = data[len(FILE_MAGIC)], data[len(FILE_MAGIC) + 1]
+    if version != FORMAT_V1:
+        raise ValueError(f"Nieobsługiwana wersja formatu pliku: {version}")
+
+    token = base64.urlsafe_b64encode(data[header_len:])
+    try:
+        decrypted = get_cipher().decrypt(token)
+    except InvalidToken:
+        raise ValueError("Klucz BACKUP_ENCRYPTION_KEY nie pasuje do tego pliku")
+    return decompress(decrypted, algorithm)
+
+
+def _read_plaintext(filepath: Path) -> str:
     """
     Odczytuje i odszyfrowuje plik.
     Dla kompatybilności wstecznej: jeśli pliku nie da się odszyfrować,
@@ -64,6 +280,12 @@ def decrypt_from_file(filepath: Path) -> str:
         with filepath.open("rb") as f:
             data = f.read()
 
+        # Format z nagłówkiem: tu klucz jest niezbędny, błąd zgłaszamy wprost
+        if stream_crypto.is_stream_file(data):
+            return b"".join(stream_crypto.decrypt_stream(io.BytesIO(data), stream_key_for(data))).decode('utf-8')
+        if data.startswith(FILE_MAGIC):
+            return _decode_container(data).decode('utf-8')
+
         # Próbujemy uzyskać cipher, ale tutaj nie chcemy "krzyczeć" błędem,
         # bo może chcemy odczytać stary plik plain-text nawet bez klucza.
         cipher = None
@@ -86,4 +308,4 @@ def decrypt_from_file(filepath: Path) -> str:
 
     except Exception as e:
         logger.error(f"Błąd odczytu pliku {filepath}: {e}")
-        return f"[BŁĄD ODCZYTU PLIKU: {e}]"
\ No newline at end of file
+        return f"{READ_ERROR_PREFIX} {e}]"
\ No newline at end of file
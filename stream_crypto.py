@@ -0,0 +1,188 @@
+# stream_crypto.py
+"""
+Strumieniowy format szyfrowania backupów (v2).
+
+Plik = nagłówek + ramki. Każda ramka jest osobno uwierzytelniona (AES-256-GCM),
+więc plik można odszyfrowywać i wysyłać ramka po ramce, w stałej pamięci.
+
+Nagłówek (26 bajtów):
+    b"OLTB" | wersja=2 (1) | kompresja (1) | id klucza (8) | rozmiar ramki (4) | prefiks nonce (8)
+Ramka:
+    flaga (1: 0 = kolejna, 1 = ostatnia) | długość szyfrogramu (4) | szyfrogram z tagiem GCM
+Nonce ramki = prefiks (8) + numer ramki (4). Do AAD trafia nagłówek, numer ramki i flaga -
+zamiana kolejności, podmiana między plikami czy obcięcie pliku są wykrywane.
+"""
+import hashlib
+import lzma
+import os
+import struct
+import zlib
+from functools import lru_cache
+from typing import BinaryIO, Iterable, Iterator
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+FILE_MAGIC = b"OLTB"
+FORMAT_V2 = 2
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+
+HEADER_STRUCT = struct.Struct(">4sBB8sI8s")
+FRAME_STRUCT = struct.Struct(">BI")
+COUNTER_STRUCT = struct.Struct(">I")
+
+FLAG_MORE = 0
+FLAG_FINAL = 1
+
+# Górny limit, żeby uszkodzony nagłówek nie wymusił alokacji gigabajtów
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+GCM_TAG_SIZE = 16
+
+
+class StreamFormatError(ValueError):
+    """Uszkodzony, obcięty lub zaszyfrowany innym kluczem plik v2."""
+
+
+@lru_cache(maxsize=16)
+def derive_key(fernet_key: bytes) -> bytes:
+    """Klucz AES-256 wyprowadzony (HKDF) z klucza BACKUP_ENCRYPTION_KEY."""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"olt-backup-stream-v2",
+    ).derive(fernet_key)
+
+
+def key_id(key: bytes) -> bytes:
+    """Krótki identyfikator klucza zapisywany w nagłówku (nie ujawnia klucza)."""
+    return hashlib.sha256(b"olt-backup-key-id" + key).digest()[:8]
+
+
+class _NoCompression:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+def _compressor(algorithm: int, level: int):
+    if algorithm == COMPRESSION_ZLIB:
+        return zlib.compressobj(level)
+    if algorithm == COMPRESSION_LZMA:
+        return lzma.LZMACompressor(preset=level)
+    return _NoCompression()
+
+
+def _decompressor(algorithm: int):
+    if algorithm == COMPRESSION_ZLIB:
+        return zlib.decompressobj()
+    if algorithm == COMPRESSION_LZMA:
+        return lzma.LZMADecompressor()
+    if algorithm == COMPRESSION_NONE:
+        return _NoCompression()
+    raise StreamFormatError(f"Nieznany algorytm kompresji: {algorithm}")
+
+
+def is_stream_file(head: bytes) -> bool:
+    return len(head) > len(FILE_MAGIC) and head.startswith(FILE_MAGIC) and head[len(FILE_MAGIC)] == FORMAT_V2
+
+
+def read_header_key_id(head: bytes) -> bytes:
+    """Id klucza z nagłówka (pozwala wybrać klucz bez próbowania odszyfrowania)."""
+    if len(head) < HEADER_STRUCT.size:
+        raise StreamFormatError("Uszkodzony nagłówek pliku backupu")
+    return HEADER_STRUCT.unpack(head[:HEADER_STRUCT.size])[3]
+
+
+def encrypt_stream(out: BinaryIO, chunks: Iterable[bytes], key: bytes, algorithm: int, level: int,
+                   frame_size: int) -> int:
+    """
+    Kompresuje i szyfruje strumień do pliku. Zwraca liczbę zapisanych bajtów.
+    key to 32-bajtowy klucz AES (patrz derive_key).
+    """
+    header = HEADER_STRUCT.pack(FILE_MAGIC, FORMAT_V2, algorithm, key_id(key), frame_size, os.urandom(8))
+    nonce_prefix = header[-8:]
+    aead = AESGCM(key)
+    written = out.write(header)
+    counter = 0
+
+    def write_frame(plain: bytes, flag: int) -> int:
+        nonlocal counter
+        counter_bytes = COUNTER_STRUCT.pack(counter)
+        ciphertext = aead.encrypt(nonce_prefix + counter_bytes, plain, header + counter_bytes + bytes((flag,)))
+        counter += 1
+        return out.write(FRAME_STRUCT.pack(flag, len(ciphertext))) + out.write(ciphertext)
+
+    compressor = _compressor(algorithm, level)
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += compressor.compress(chunk)
+        while len(buffer) >= frame_size:
+            written += write_frame(bytes(buffer[:frame_size]), FLAG_MORE)
+            del buffer[:frame_size]
+
+    buffer += compressor.flush()
+    while len(buffer) > frame_size:
+        written += write_frame(bytes(buffer[:frame_size]), FLAG_MORE)
+        del buffer[:frame_size]
+    written += write_frame(bytes(buffer), FLAG_FINAL)
+    return written
+
+
+def _read_exact(src: BinaryIO, size: int) -> bytes:
+    data = src.read(size)
+    if len(data) != size:
+        raise StreamFormatError("Plik backupu jest obcięty")
+    return data
+
+
+def decrypt_stream(src: BinaryIO, key: bytes) -> Iterator[bytes]:
+    """Generator odszyfrowanych (i rozpakowanych) porcji treści. Pamięć: jedna ramka."""
+    header = _read_exact(src, HEADER_STRUCT.size)
+    magic, version, algorithm, file_key_id, frame_size, nonce_prefix = HEADER_STRUCT.unpack(header)
+    if magic != FILE_MAGIC or version != FORMAT_V2:
+        raise StreamFormatError("To nie jest plik w formacie v2")
+    if file_key_id != key_id(key):
+        raise StreamFormatError("Plik zaszyfrowano innym kluczem")
+    if frame_size > MAX_FRAME_SIZE:
+        raise StreamFormatError("Nieprawidłowy rozmiar ramki w nagłówku")
+
+    aead = AESGCM(key)
+    decompressor = _decompressor(algorithm)
+    max_ciphertext = frame_size + GCM_TAG_SIZE
+    counter = 0
+
+    while True:
+        flag, length = FRAME_STRUCT.unpack(_read_exact(src, FRAME_STRUCT.size))
+        if length > max_ciphertext or flag not in (FLAG_MORE, FLAG_FINAL):
+            raise StreamFormatError("Uszkodzona ramka pliku backupu")
+
+        ciphertext = _read_exact(src, length)
+        counter_bytes = COUNTER_STRUCT.pack(counter)
+        try:
+            plain = aead.decrypt(nonce_prefix + counter_bytes, ciphertext, header + counter_bytes + bytes((flag,)))
+        except Exception:
+            raise StreamFormatError(f"Ramka {counter} nie przeszła weryfikacji (uszkodzony plik lub zły klucz)")
+        counter += 1
+
+        data = decompressor.decompress(plain)
+        if data:
+            yield data
+
+        if flag == FLAG_FINAL:
+            if src.read(1):
+                raise StreamFormatError("Dane po ostatniej ramce pliku backupu")
+            flush = getattr(decompressor, "flush", None)
+            tail = flush() if flush else b""
+            if tail:
+                yield tail
+            return
@@ -1,4 +1,14 @@
 # text_processing.py
+import hashlib
+import re
+from typing import Iterable, Iterator, Optional, Pattern
+
+# Prefiksy linii, które NIE są kontynuacją poprzedniej (patrz join_lines)
+JOIN_PREFIXES = ("#", "[", "ip", "ntp", "aaa", "return", "interface", "multicast")
+
+# Znaki kończące linię wg str.splitlines()
+LINE_BOUNDARIES = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
 
 def remove_empty_lines(text: str) -> str:
     """
@@ -15,7 +25,7 @@ def join_lines(text: str) -> str:
       - oraz nie zaczyna się od jednego z określonych prefiksów,
     to jest dołączana do poprzedniej linii.
     """
-    prefixes = ("#", "[", "ip", "ntp", "aaa", "return", "interface", "multicast")
+    prefixes = JOIN_PREFIXES
     lines = text.splitlines()
     new_lines = []
     for line in lines:
@@ -45,26 +55,113 @@ def trim_text(text: str) -> str:
     return "\n".join(lines)
 
 
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Dzieli strumień fragmentów tekstu na linie dokładnie tak jak str.splitlines(),
+    również gdy granica linii (np. "\\r\\n") wypada między fragmentami.
+    """
+    pending = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending += chunk
+        lines = pending.splitlines()
+
+        last_char = pending[-1]
+        if last_char not in LINE_BOUNDARIES:
+            # Ostatnia linia niedokończona - czeka na kolejny fragment
+            pending = lines.pop()
+        elif last_char == "\r":
+            # "\r" może być pierwszą połową "\r\n" z następnego fragmentu
+            pending = lines.pop() + "\r"
+        else:
+            pending = ""
+
+        yield from lines
+
+    if pending:
+        yield from pending.splitlines()
+
+
+def _iter_trimmed(lines: Iterable[str]) -> Iterator[str]:
+    """Strumieniowy odpowiednik trim_text: kończy na pierwszej parze '#' + 'return'."""
+    held = None  # linia '#', która może rozpoczynać znacznik końca
+    for line in lines:
+        if held is not None:
+            if line.strip() == "return":
+                yield held
+                yield line
+                return
+            yield held
+            held = None
+
+        if line.strip() == "#":
+            held = line
+        else:
+            yield line
+
+    if held is not None:
+        yield held
+
+
+def iter_processed_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Jednoprzebiegowa wersja process_text: przycinanie po znaczniku końca,
+    pominięcie pierwszej linii, usuwanie pustych linii i łączenie kontynuacji
+    wykonywane linia po linii, bez ponownego dzielenia i sklejania całego tekstu.
+    """
+    lines = _iter_trimmed(iter_lines(chunks))
+
+    # Pierwsza linia (echo komendy) jest pomijana
+    next(lines, None)
+
+    current = None
+    for line in lines:
+        if not line.strip():
+            continue
+        if current is not None and not line[0].isspace() and not line.startswith(JOIN_PREFIXES):
+            current = current.rstrip() + line
+            continue
+        if current is not None:
+            yield current
+        current = line
+
+    if current is not None:
+        yield current
+
+
+def process_chunks(chunks: Iterable[str]) -> str:
+    """process_text dla tekstu podanego we fragmentach (np. prosto z bufora SSH)."""
+    return "\n".join(iter_processed_lines(chunks))
+
+
 def process_text(text: str) -> str:
     """
     Przetwarza tekst wykonując następujące kroki:
-      1. Przycinanie tekstu za pomocą funkcji trim_text.
+      1. Przycinanie tekstu (jak trim_text).
       2. Usuwanie pierwszej linii.
-      3. Usuwanie pustych linii za pomocą funkcji remove_empty_lines.
-      4. Łączenie linii za pomocą funkcji join_lines.
+      3. Usuwanie pustych linii (jak remove_empty_lines).
+      4. Łączenie linii (jak join_lines).
+    Wszystkie kroki wykonywane są w jednym przebiegu - patrz iter_processed_lines.
     """
-    # Krok 1: Przytnij tekst według markerów
-    trimmed = trim_text(text)
+    return process_chunks((text,))
 
-    # Krok 2: Usuń pierwszą linię, jeśli istnieje
-    lines = trimmed.splitlines()
-    if lines:
-        lines = lines[1:]
-    no_first = "\n".join(lines)
 
-    # Krok 3: Usuń puste linie
-    no_empty = remove_empty_lines(no_first)
+def content_fingerprint(text: str, volatile_re: Optional[Pattern] = None) -> str:
+    """
+    SHA-256 konfiguracji po normalizacji: bez pustych linii, końcowych spacji
+    i linii pasujących do volatile_re (liczniki, znaczniki czasu).
+    Dwie konfiguracje różniące się tylko takimi liniami mają ten sam odcisk.
+    """
+    digest = hashlib.sha256()
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or (volatile_re and volatile_re.search(line)):
+            continue
+        digest.update(line.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
 
-    # Krok 4: Połącz linie zgodnie z regułami
-    joined = join_lines(no_empty)
-    return joined
+def compile_volatile_pattern(pattern: str) -> Optional[Pattern]:
+    return re.compile(pattern, re.IGNORECASE) if pattern else None
@@ -1,10 +1,18 @@
 # webapp.py
+import signal
+import threading
+from pathlib import Path
+
 import click
 from flask import Flask, request
 from sqlalchemy import text
 
 # Importy lokalne
 import config
+import key_rotation
+import metrics
+import run_lease
+from pagination import page_url
 from extensions import db, login_manager
 from models import User, Device, Settings, BackupLog
 
@@ -15,6 +23,8 @@ from routes.main_bp import main_bp
 from routes.device_bp import device_bp
 from routes.backup_bp import backup_bp
 from routes.settings_bp import settings_bp
+from routes.api_bp import api_bp
+from routes.metrics_bp import metrics_bp
 
 # Import serwisu backupu (instancja)
 from services import backup_service
@@ -33,6 +43,14 @@ app.register_blueprint(main_bp)
 app.register_blueprint(device_bp)
 app.register_blueprint(backup_bp)
 app.register_blueprint(settings_bp)
+app.register_blueprint(api_bp)
+app.register_blueprint(metrics_bp)
+
+# Czas obsługi zapytań per blueprint (/metrics)
+metrics.init_app(app)
+
+# Linki stron / sortowania list w szablonach
+app.add_template_global(page_url)
 
 # Inicjalizacja serwisu backupu (przypisanie app)
 backup_service.init_app(app)
@@ -91,24 +109,68 @@ def init_db():
     print("Baza danych zainicjalizowana.")
 
 
+# Kolumny dodawane do istniejących baz (SQLite: ALTER nie powiedzie się, jeśli kolumna już jest;
+# PostgreSQL: ADD COLUMN IF NOT EXISTS - patrz _postgres_statement)
+SCHEMA_UPDATES = [
+    "ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0",
+    "ALTER TABLE backup_logs ADD COLUMN trigger_type VARCHAR(20) DEFAULT 'manual'",
+    "ALTER TABLE backup_logs ADD COLUMN content_hash VARCHAR(64)",
+    "ALTER TABLE backup_logs ADD COLUMN unchanged BOOLEAN DEFAULT 0",
+    "ALTER TABLE backup_logs ADD COLUMN base_filename VARCHAR(200)",
+    "ALTER TABLE backup_logs ADD COLUMN logical_size_bytes INTEGER",
+    "ALTER TABLE devices ADD COLUMN updated_at DATETIME",
+    "CREATE INDEX IF NOT EXISTS ix_devices_updated_at ON devices (updated_at)",
+    "ALTER TABLE devices ADD COLUMN latest_success_log_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_backup_logs_device_status_created ON backup_logs (device_ip, status, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_backup_logs_device_created ON backup_logs (device_ip, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_backup_logs_filename ON backup_logs (filename)",
+    "CREATE INDEX IF NOT EXISTS ix_backup_logs_base_filename ON backup_logs (base_filename)",
+    "ALTER TABLE devices ADD COLUMN ip_sort_key VARCHAR(40)",
+    "CREATE INDEX IF NOT EXISTS ix_devices_ip_sort_key ON devices (ip_sort_key)",
+    "ALTER TABLE devices ADD COLUMN consecutive_failures INTEGER DEFAULT 0",
+    "ALTER TABLE devices ADD COLUMN last_rtt_ms FLOAT",
+    "ALTER TABLE devices ADD COLUMN avg_connect_seconds FLOAT",
+    "ALTER TABLE devices ADD COLUMN circuit_open_until DATETIME",
+    "ALTER TABLE devices ADD COLUMN avg_backup_seconds FLOAT",
+    "ALTER TABLE backup_logs ADD COLUMN run_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_backup_logs_run_id ON backup_logs (run_id)",
+    "ALTER TABLE backup_logs ADD COLUMN duration_seconds FLOAT",
+    "ALTER TABLE backup_logs ADD COLUMN bytes_received INTEGER",
+    "ALTER TABLE backup_logs ADD COLUMN timings TEXT",
+    "ALTER TABLE backup_jobs ADD COLUMN heartbeat_at DATETIME",
+    "CREATE INDEX IF NOT EXISTS ix_backup_jobs_status_heartbeat ON backup_jobs (status, heartbeat_at)",
+]
+
+
+def _postgres_statement(statement: str) -> str:
+    """Wersja polecenia z SCHEMA_UPDATES dla PostgreSQL (typy i idempotentne ADD COLUMN)."""
+    return statement.replace("ADD COLUMN", "ADD COLUMN IF NOT EXISTS") \
+        .replace("DATETIME", "TIMESTAMP") \
+        .replace("BOOLEAN DEFAULT 0", "BOOLEAN DEFAULT FALSE")
+
+
 @app.cli.command("update-schema")
 def update_schema():
     try:
         with app.app_context():
-            if 'sqlite' in config.SQLALCHEMY_DATABASE_URI:
-                with db.engine.connect() as conn:
+            # Nowe tabele (np. run_leases) - create_all nie rusza istniejących
+            db.create_all()
+            dialect = db.engine.dialect.name
+            if dialect not in ('sqlite', 'postgresql'):
+                print(f"Update schema only for SQLite and PostgreSQL (not {dialect}).")
+                return
+            with db.engine.connect() as conn:
+                for statement in SCHEMA_UPDATES:
+                    if dialect == 'postgresql':
+                        statement = _postgres_statement(statement)
                     try:
-                        conn.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0"))
+                        conn.execute(text(statement))
+                        conn.commit()
                     except Exception:
-                        pass
-                    try:
-                        conn.execute(
-                            text("ALTER TABLE backup_logs ADD COLUMN trigger_type VARCHAR(20) DEFAULT 'manual'"))
-                    except Exception:
-                        pass
-                    conn.commit()
-            else:
-                print("Update schema only for SQLite.")
+                        conn.rollback()
+            # Wskaźniki "ostatni udany backup" dla historii sprzed ich wprowadzenia
+            Device.rebuild_latest_success()
+            Device.rebuild_ip_sort_keys()
     except Exception as e:
         print(f"Error: {e}")
 
@@ -138,6 +200,7 @@ def import_devices():
         for ip in ips:
             if not Device.query.filter_by(ip=ip).first():
                 d = Device(ip=ip, enabled=True)
+                d.refresh_latest_success()
                 db.session.add(d)
                 count += 1
         db.session.commit()
@@ -146,6 +209,45 @@ def import_devices():
         print("Plik devices.txt nie istnieje.")
 
 
+@app.cli.command("rotate-keys")
+@click.option("--workers", type=int, default=config.KEY_ROTATION_WORKERS, show_default=True)
+@click.option("--max-mbps", type=float, default=config.KEY_ROTATION_MAX_MBPS, show_default=True,
+              help="Limit odczytu+zapisu w MB/s (0 = bez limitu).")
+@click.option("--dry-run", is_flag=True, help="Tylko sprawdź, które pliki wymagają przeszyfrowania.")
+def rotate_keys(workers, max_mbps, dry_run):
+    """Przeszyfrowuje backupy bieżącym kluczem (stare klucze z BACKUP_ENCRYPTION_OLD_KEYS). Można wznawiać."""
+    def update_size(filename, size):
+        BackupLog.query.filter_by(filename=filename).update({"size_bytes": size})
+        db.session.commit()
+
+    try:
+        stats = key_rotation.rotate_backup_dir(Path(config.BACKUP_DIR), max(1, workers), max_mbps, dry_run,
+                                               on_rotated=update_size)
+    except ValueError as e:
+        print(f"Błąd: {e}")
+        return
+    label = "Do przeszyfrowania" if dry_run else "Przeszyfrowano"
+    print(f"{label}: {stats['rotated']}, bez zmian: {stats['skipped']}, błędy: {stats['failed']} "
+          f"(plików: {stats['total']}).")
+
+
+@app.cli.command("backup-worker")
+@click.option("--threads", type=int, default=config.BACKUP_MAX_WORKERS, show_default=True,
+              help="Liczba urządzeń backupowanych jednocześnie przez tego workera.")
+def backup_worker(threads):
+    """Worker kolejki backupu - wykonuje zadania uruchomień zleconych z panelu lub crona (można uruchomić wiele)."""
+    stop = threading.Event()
+
+    def handle_stop(signum, frame):
+        print("Zatrzymywanie workera - dokańczam rozpoczęte zadania...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    metrics.remove_dead_process_files()
+    backup_service.run_worker(max(1, threads), stop)
+
+
 @app.cli.command("reset-stuck")
 def reset_stuck_command():
     """Ręczne resetowanie zawieszonych statusów (klepsydry)."""
@@ -161,6 +263,9 @@ def reset_stuck_backups():
     """
     try:
         with app.app_context():
+            # Backup może właśnie trwać w innym procesie (np. kontener cron) - wtedy to nie są "zombie"
+            if run_lease.active_lease() is not None:
+                return
             stuck_devices = Device.query.filter_by(last_status='running').all()
             if stuck_devices:
                 print(f" ---> [SYSTEM] Wykryto {len(stuck_devices)} przerwanych zadań backupu. Resetowanie statusów...")